@@ -4,20 +4,33 @@ import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
 from dash.exceptions import PreventUpdate
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
 
 # Import helper modules
 import requests, base64, io
+import numpy as np
 import pandas as pd
 from flask import Flask
 from datetime import datetime
 from random import randint
 
 # Import custom modules
-from settings import INITIAL_COUNTRIES, GRAPH_SCALE_OPTIONS, DATE_FORMAT, EXTERNAL_STYLESHEETS
+from settings import INITIAL_COUNTRIES, GRAPH_SCALE_OPTIONS, DATE_FORMAT, EXTERNAL_STYLESHEETS, DATA_REFRESH_INTERVAL, DATA_LOAD_ON_IMPORT, CLIENTSIDE_GRAPH, SIR_FIT_ENABLED, METRICS_ENABLED, QUERY_CACHE_SIZE, RANKING_MAX_RESULTS
 from settings.markdown_text import JHCCU_TITLE, JHCCU_INFO_TEXT
 from pandemic_models.sir_model import SIR
-from data_api.apis import get_population_by_country_dict, generate_dataframes_dict
+from pandemic_models.fitting import SIRFitService
+from data_api.refresh import DataStore
+from data_api.rankings import parse_query_arguments, get_ranking, register_ranking_api
+from data_api.export import register_export_api
+from data_api.regions import REGION_LEVELS
+from figures.cache import FigureCache
+from figures.serialize import TraceSerializer
+from figures.rolling import select_block, RollingIndexCache
+from figures.layout import CachedLayoutDash
+from monitoring.metrics import REGISTRY, CALLBACK_SECONDS, FIGURE_BUILD_SECONDS, timed, instrument_callbacks, instrument_server
+from monitoring.profiling import init_profiling
+from figures.compression import init_http_caching
+from monitoring.health import register_health_routes
 
 # Server serttings
 FRAMEWORK_STYLESHEETS = [
@@ -29,62 +42,135 @@ FRAMEWORK_STYLESHEETS = [
 # Server initialization
 server = Flask(__name__)
 server.secret_key = os.environ.get('COVID_APP_SECRET_KEY', str(randint(0, 100000000000)))
-app = dash.Dash(__name__, external_stylesheets=FRAMEWORK_STYLESHEETS+EXTERNAL_STYLESHEETS,include_assets_files=True, server=server)
+# The layout depends on the loaded data, so callbacks are registered before the components they refer to exist.
+# It is rendered to JSON once per data version
+app = CachedLayoutDash(__name__, external_stylesheets=FRAMEWORK_STYLESHEETS+EXTERNAL_STYLESHEETS,include_assets_files=True, server=server, compress=False, suppress_callback_exceptions=True, layout_version=lambda: data_store.current and data_store.current.version)
 app.title = 'covid-19 Dashboard by Jan Macenka'
 app.css.config.serve_locally = True
 
 # Helper Functions
+DAY_LABELS = np.array([str(day) for day in range(32)], dtype=object)
+MONTH_LABELS = [datetime(2020, month, 1).strftime('%b') if month else '' for month in range(13)]
+
 def index_to_date(date_list,n_index):
     return date_list[n_index].strftime(DATE_FORMAT)
 
 def get_slider_marks(dates_list,num_marks=15):
-    mark_stepsize = len(dates_list) // num_marks
-    dates = {}
-    for idx, date in enumerate(dates_list):
-        if date.day == 1 or idx == 0:
-            dates[idx]={
-                'label':date.strftime('%b'),
-                'style':{'font-weight': 'bold','size':'5px', 'transform': 'rotate(70deg)'},
-            }
-        elif date.day % mark_stepsize == 0:
-            dates[idx]=str(date.day)
-        else:
-            dates[idx] = ''
-    return dates
+    # Month names on the first of each month, the day on every mark_stepsize-th day and empty marks elsewhere,
+    # computed on the whole date index at once. Only the month marks are created one by one
+    dates_list = pd.DatetimeIndex(dates_list)
+    mark_stepsize = max(len(dates_list) // num_marks, 1)
+    days = dates_list.day.to_numpy()
+    month_marks = np.flatnonzero(days == 1)
+    if len(days) and days[0] != 1:
+        month_marks = np.concatenate([[0], month_marks])
+    labels = np.where(days % mark_stepsize == 0, DAY_LABELS[days], '')
+    labels[month_marks] = [
+        {'label':MONTH_LABELS[month], 'style':{'font-weight': 'bold','size':'5px', 'transform': 'rotate(70deg)'}}
+        for month in dates_list.month.to_numpy()[month_marks]
+    ]
+    return dict(zip(range(len(labels)), labels.tolist()))
+
+def get_cached_slider_marks(state):
+    return figure_cache.get_or_build((state.version, 'slider-marks'), lambda: get_slider_marks(state.dates))
+
+def current_state():
+    # Callbacks of pages served before the first data version was loaded have nothing to update
+    state = data_store.current
+    if state is None:
+        raise PreventUpdate
+    return state
 
-def get_country_data_df(data_selection_value:str, data_evaluation_value:str, country:str, range_slider_value:list):
+def get_region_options(dfs, country_selection_value:list):
+    # Countries plus the provinces (and counties) of the selected regions, so the dropdown drills down
+    return [{'label':region,'value':region} for region in dfs.regions.expand(dfs.countries, country_selection_value)]
+
+def get_country_data_df(dfs, data_selection_value:str, data_evaluation_value:str, country:str, range_slider_value:list):
     return dfs[data_selection_value][data_evaluation_value]['data'][country][range_slider_value[0] : range_slider_value[-1]]
 
-def build_graph(country_selection_value, range_slider_value, yaxis_data_selection_value, xaxis_data_selection_value, yaxis_data_evaluation_value, xaxis_data_evaluation_value, yaxis_type_value, xaxis_type_value, yaxis_averaging_days, xaxis_averaging_days, data=None, *args, **kwargs):
+def get_axis_traces(dfs, data_selection_value:str, data_evaluation_value:str, averaging_days:int, country_selection_value:list, range_slider_value:list):
+    # Trace data of all selected countries for one axis, moving averages come from the precomputed index of the frame
+    if data_selection_value == 'time':
+        return [trace_serializer.encode_dates(dfs, range_slider_value)] * len(country_selection_value)
+    index = rolling_indexes.get(dfs[data_selection_value][data_evaluation_value]['data'])
+    return [trace_serializer.encode_values(column) for column in index.moving_average(country_selection_value, range_slider_value, averaging_days).T]
+
+def get_axis_series(dfs, data_selection_value:str, data_evaluation_value:str, country_selection_value:list):
+    # Full, unsmoothed series of one axis, windowing and smoothing happen in assets/clientside.js
+    values = None
+    if data_selection_value != 'time':
+        block = select_block(dfs[data_selection_value][data_evaluation_value]['data'], country_selection_value, [0, len(dfs.dates)])
+        values = [trace_serializer.encode_values(column) for column in block.T]
+    return {
+        'selection':data_selection_value,
+        'evaluation':data_evaluation_value,
+        'unit':dfs[data_selection_value][data_evaluation_value]['unit'],
+        'values':values,
+    }
+
+@timed(FIGURE_BUILD_SECONDS, builder='build_graph_series')
+def build_graph_series(country_selection_value, yaxis_data_selection_value, xaxis_data_selection_value, yaxis_data_evaluation_value, xaxis_data_evaluation_value, dfs=None, *args, **kwargs):
+    country_selection_value = country_selection_value or []
+    return {
+        'dates':trace_serializer.encode_dates(dfs, [0, len(dfs.dates)]),
+        'countries':country_selection_value,
+        'yaxis':get_axis_series(dfs, yaxis_data_selection_value, yaxis_data_evaluation_value, country_selection_value),
+        'xaxis':get_axis_series(dfs, xaxis_data_selection_value, xaxis_data_evaluation_value, country_selection_value),
+        'scale_options':GRAPH_SCALE_OPTIONS,
+    }
+
+def get_held_series(data_version, country_selection_value, yaxis_data_selection_value, xaxis_data_selection_value, yaxis_data_evaluation_value, xaxis_data_evaluation_value, *args, **kwargs):
+    # What the browser holds in 'graph-series' once it merged a delta, comes back as state with the next change
+    return {
+        'version':data_version,
+        'countries':list(country_selection_value),
+        'yaxis':[yaxis_data_selection_value, None if yaxis_data_selection_value == 'time' else yaxis_data_evaluation_value],
+        'xaxis':[xaxis_data_selection_value, None if xaxis_data_selection_value == 'time' else xaxis_data_evaluation_value],
+    }
+
+@timed(FIGURE_BUILD_SECONDS, builder='build_graph_series_delta')
+def build_graph_series_delta(held_series, country_selection_value, yaxis_data_selection_value, xaxis_data_selection_value, yaxis_data_evaluation_value, xaxis_data_evaluation_value, dfs=None, *args, **kwargs):
+    # Only what the browser doesn't hold yet: the series of added countries, or of all countries for an axis whose
+    # dataset changed. Removed countries just drop out of the countries list, assets/clientside.js merges the delta
+    held_countries = set(held_series['countries'])
+    added = [country for country in country_selection_value if country not in held_countries]
+    target = get_held_series(held_series['version'], country_selection_value, yaxis_data_selection_value, xaxis_data_selection_value, yaxis_data_evaluation_value, xaxis_data_evaluation_value)
+    delta = {'reset':False, 'countries':list(country_selection_value), 'added':added}
+    for axis, data_selection_value, data_evaluation_value in [('yaxis', yaxis_data_selection_value, yaxis_data_evaluation_value), ('xaxis', xaxis_data_selection_value, xaxis_data_evaluation_value)]:
+        if held_series[axis] == target[axis]:
+            delta[axis] = {'reset':False, 'values':get_axis_series(dfs, data_selection_value, data_evaluation_value, added)['values']}
+        else:
+            delta[axis] = dict(get_axis_series(dfs, data_selection_value, data_evaluation_value, country_selection_value), reset=True)
+    return delta
+
+@timed(FIGURE_BUILD_SECONDS, builder='build_graph')
+def build_graph(country_selection_value, range_slider_value, yaxis_data_selection_value, xaxis_data_selection_value, yaxis_data_evaluation_value, xaxis_data_evaluation_value, yaxis_type_value, xaxis_type_value, yaxis_averaging_days, xaxis_averaging_days, dfs=None, data=None, *args, **kwargs):
     data = []
     if not country_selection_value:
         return None
-    for country in country_selection_value:
-        y = get_country_data_df(yaxis_data_selection_value, yaxis_data_evaluation_value, country, range_slider_value)
-        x = get_country_data_df(xaxis_data_selection_value, xaxis_data_evaluation_value, country, range_slider_value)
-        y_unit = dfs[yaxis_data_selection_value][yaxis_data_evaluation_value]['unit']
-        x_unit = dfs[xaxis_data_selection_value][xaxis_data_evaluation_value]['unit']
-        yaxis_type = 'lin'
-        xaxis_type = 'lin'
-        yaxis_title = str(yaxis_data_selection_value)
-        xaxis_title = str(xaxis_data_selection_value)
-        if yaxis_data_selection_value != 'time':
-            y = y.rolling(yaxis_averaging_days).mean()
-            yaxis_type = yaxis_type_value
-            if yaxis_averaging_days > 1:
-                yaxis_title += f' with moving average of {yaxis_averaging_days} days'
-        if xaxis_data_selection_value != 'time':
-            x = x.rolling(xaxis_averaging_days).mean()
-            xaxis_type = xaxis_type_value
-            if xaxis_averaging_days > 1:
-                xaxis_title += f' with moving average of {xaxis_averaging_days} days'
-        yaxis_title += f'<br>[{y_unit}]'
-        xaxis_title += f'<br>[{x_unit}]'    
-        
+    y_unit = dfs[yaxis_data_selection_value][yaxis_data_evaluation_value]['unit']
+    x_unit = dfs[xaxis_data_selection_value][xaxis_data_evaluation_value]['unit']
+    yaxis_type = 'lin'
+    xaxis_type = 'lin'
+    yaxis_title = str(yaxis_data_selection_value)
+    xaxis_title = str(xaxis_data_selection_value)
+    if yaxis_data_selection_value != 'time':
+        yaxis_type = yaxis_type_value
+        if yaxis_averaging_days > 1:
+            yaxis_title += f' with moving average of {yaxis_averaging_days} days'
+    if xaxis_data_selection_value != 'time':
+        xaxis_type = xaxis_type_value
+        if xaxis_averaging_days > 1:
+            xaxis_title += f' with moving average of {xaxis_averaging_days} days'
+    yaxis_title += f'<br>[{y_unit}]'
+    xaxis_title += f'<br>[{x_unit}]'    
+    ys = get_axis_traces(dfs, yaxis_data_selection_value, yaxis_data_evaluation_value, yaxis_averaging_days, country_selection_value, range_slider_value)
+    xs = get_axis_traces(dfs, xaxis_data_selection_value, xaxis_data_evaluation_value, xaxis_averaging_days, country_selection_value, range_slider_value)
+
+    for country, x, y in zip(country_selection_value, xs, ys):
         data.append(dict(
             x=x,
             y=y,
-            text=country_selection_value,
             mode='line',
             opacity=.7,
             marker={
@@ -110,280 +196,429 @@ def build_graph(country_selection_value, range_slider_value, yaxis_data_selectio
     )
     return graph
 
-global list_of_avaliable_countries, evaluation_options, list_of_available_dates, dfs, country_population_dict
-list_of_avaliable_countries, evaluation_options, list_of_available_dates, dfs = generate_dataframes_dict()
-country_population_dict = get_population_by_country_dict()
-
-app.layout = dbc.Jumbotron(
-    id='root',
-    className='container my-5',
-    children = [
-        dcc.Location(id='url', refresh=False),        
-        html.Div(
-            id='header-information',
-            className='text-center',
-            style={'textAlign': 'center',},
-            children=[
-                html.H1(
-                    children=[
-                        "Interactive visualization of covid-19 progression",
-                    ],
-                ),
-                html.H3(
-                    # className='text-warning',
-                    children=[
-                    "with data from Johns Hopkins University",
-                    ],
-                ),
-                dbc.Button(
-                    id='open-info-modal',
-                    className='btn-primary',
-                    children=[
-                        "About this App"
-                    ]
-                ),                
-                dbc.Modal(
-                    id='info-modal',
-                    size='xl',
-                    children=[
-                        dbc.ModalHeader(
-                            className='text-center',
-                            children=[
-                                dcc.Markdown(
-                                    children=JHCCU_TITLE,
-                                ),
-                            ],    
-                        ),
-                        dbc.ModalBody(
-                            children=[
-                                dcc.Markdown(JHCCU_INFO_TEXT),
-                            ]
-                        ),
-                        dbc.ModalFooter(
-                            className='text-right',
-                            children=[
-                                html.Blockquote(
-                                    html.Cite('created by Jan Macenka',)
-                                ),
-                                dbc.Button("Close", id="close-info-modal", className="ml-auto"),
-                            ]
-                        ),
-                    ],
-                ),
-                html.Hr(
-                    className="my-2"
-                ),
-            ],
-        ),
-        dcc.Tab(
-            id='data-visualization-tab',
-            label='Data-Visualization',
-            children=[
-                dbc.Row(
-                    className='my-2',
-                    children=[
-                        dbc.Col(
-                            id='yaxis-settings-col',
-                            children=[
-                                html.H3(
-                                    className='centered p-2',
-                                    children='Y-axis',
-                                ),
-                                dbc.Card(
-                                    className='border-5 rounded py-2 m-2 bg-light',
-                                    children= [        
-                                        html.P(
-                                            className='centered text-muted pt-2',
-                                            children='data',
-                                        ),                                                                 
-                                        dbc.RadioItems(
-                                            id="yaxis-data-selection",
-                                            value= list(dfs.keys())[0],
-                                            className="date-group-items centered pb-2",
-                                            labelClassName="date-group-labels btn btn-warning",
-                                            labelCheckedClassName="date-group-labels-checked",
-                                            inline=True,
-                                            options=[
-                                                {'value':key, 'label': key} for key in dfs.keys()
-                                            ],
-                                        ),
-                                        html.P(
-                                            className='centered text-muted pt-2',
-                                            children='evaluation',
-                                        ),                                                     
-                                        dbc.RadioItems(
-                                            id='yaxis-data-evaluation',
-                                            value = list(evaluation_options)[0],
-                                            className="date-group-items centered pb-2",
-                                            labelClassName="date-group-labels btn btn-warning",
-                                            labelCheckedClassName="date-group-labels-checked",
-                                            inline=True,
-                                            options=[
-                                                {'value':key, 'label': key} for key in evaluation_options
-                                            ],
-                                        ),
-                                        html.P(
-                                            className='centered text-muted pt-2',
-                                            children='axis scale',
-                                        ),
-                                        dbc.RadioItems(
-                                            id='yaxis-type',
-                                            value=list(GRAPH_SCALE_OPTIONS.keys())[-1],
-                                            className="date-group-items centered pb-2",
-                                            labelClassName="date-group-labels btn btn-warning",
-                                            labelCheckedClassName="date-group-labels-checked",
-                                            inline=True,
-                                            options=[{'value': value, 'label': label} for value, label in GRAPH_SCALE_OPTIONS.items()],
-                                        ),
-                                        html.P(
-                                            className='centered text-muted pt-2',
-                                            children='number of moving average days',
-                                        ),                                                         
-                                        dbc.RadioItems(
-                                            id='yaxis-averaging-range-slider',
-                                            value=1,
-                                            className="date-group-items centered pb-2",
-                                            labelClassName="date-group-labels btn btn-warning",
-                                            labelCheckedClassName="date-group-labels-checked",
-                                            inline=True,
-                                            options=[{'value': value, 'label': value} for value in range(1,8,1)],
-                                        ),                                                        
-                                    ],
-                                ),
-                            ],
-                        ),
-                        dbc.Col(
-                            id='xaxis-settings-col',
-                            children=[
-                                html.H3(
-                                    className='centered p-2',
-                                    children='X-axis',
-                                ),
-                                dbc.Card(
-                                    className='border-5 rounded py-2 m-2 bg-light',
-                                    children= [        
-                                        html.P(
-                                            className='centered text-muted pt-2',
-                                            children='data',
-                                        ),                                                                 
-                                        dbc.RadioItems(
-                                            id="xaxis-data-selection",
-                                            value= list(dfs.keys())[-1],
-                                            className="date-group-items centered pb-2",
-                                            labelClassName="date-group-labels btn btn-warning",
-                                            labelCheckedClassName="date-group-labels-checked",
-                                            inline=True,
-                                            options=[
-                                                {'value':key, 'label': key} for key in dfs.keys()
-                                            ],
-                                        ),
-                                        html.P(
-                                            className='centered text-muted pt-2',
-                                            children='evaluation',
-                                        ),                                                     
-                                        dbc.RadioItems(
-                                            id='xaxis-data-evaluation',
-                                            value = list(evaluation_options)[0],
-                                            className="date-group-items centered pb-2",
-                                            labelClassName="date-group-labels btn btn-warning",
-                                            labelCheckedClassName="date-group-labels-checked",
-                                            inline=True,
-                                            options=[
-                                                {'value':key, 'label': key} for key in evaluation_options
-                                            ],
-                                        ),
-                                        html.P(
-                                            className='centered text-muted pt-2',
-                                            children='axis scale',
-                                        ),
-                                        dbc.RadioItems(
-                                            id='xaxis-type',
-                                            value=list(GRAPH_SCALE_OPTIONS.keys())[-1],
-                                            className="date-group-items centered pb-2",
-                                            labelClassName="date-group-labels btn btn-warning",
-                                            labelCheckedClassName="date-group-labels-checked",
-                                            inline=True,
-                                            options=[{'value': value, 'label': label} for value, label in GRAPH_SCALE_OPTIONS.items()],
-                                        ),
-                                        html.P(
-                                            className='centered text-muted pt-2',
-                                            children='number of moving average days',
-                                        ),                                                         
-                                        dbc.RadioItems(
-                                            id='xaxis-averaging-range-slider',
-                                            value=1,
-                                            className="date-group-items centered pb-2",
-                                            labelClassName="date-group-labels btn btn-warning",
-                                            labelCheckedClassName="date-group-labels-checked",
-                                            inline=True,
-                                            options=[{'value': value, 'label': value} for value in range(1,8,1)],
-                                        ),                                                       
-                                    ],
-                                ),
-                            ],
-                        ),                                        
-                    ],
-                ),
-                html.P(
-                    className='centered text-muted pt-2',
-                    children='country selection',
-                ),                            
-                dcc.Dropdown(
-                    id='country-selection',
-                    value = INITIAL_COUNTRIES,
-                    placeholder='Select some countries...',
-                    multi=True,
-                    className='m-2',
-                    persistence=True,
-                    options=[
-                        {'label':country,'value':country} for country in list_of_avaliable_countries
-                    ],
-                ),
-                html.Div(
-                    id='data-visualitaion-graph',
-                    children=['populated by callback'],
-                ),
-                dcc.RangeSlider(
-                    id='date-range-slider',
-                    className='mb-5 pb-2 mx-2',
-                    updatemode='drag',
-                    min=0,
-                    max=(len(list_of_available_dates) - 1),
-                    count=1,
-                    step=1,
-                    allowCross=True,
-                    pushable=2,
-                    value=[0, (len(list_of_available_dates) - 1)],
-                    marks=get_slider_marks(list_of_available_dates),
-                    persistence=True,
-                ),
-            ],
-        ),
-        html.Footer(
-            id='footer-information',
-            className='text-muted border-top text-center pt-2',
-            children=[
-                dcc.Link(
-                    id='github-repo-link',
-                    href='https://github.com/jmacenka/dash-covid-19-visualization',
-                    children=[
-                        'App source code',
-                    ],
-                ),
-                html.Br(),
-                html.A(
-                    id='footer-email-to-developer',
-                    href='mailto:corona.macenka.de@gmx.net',
-                    children=[
-                        'Email to developer'
-                    ],
-                ),
-                html.Br(),
-                'App by Jan Macenka - 29.03.2020',
-            ]    
-        ),
+data_store = DataStore()
+sir_fit_service = SIRFitService(data_store)
+figure_cache = FigureCache()
+trace_serializer = TraceSerializer()
+rolling_indexes = RollingIndexCache()
+data_store.subscribe(lambda state: rolling_indexes.clear())
+query_cache = FigureCache(max_size=QUERY_CACHE_SIZE, cache_dir='')
+data_store.subscribe(lambda state: query_cache.clear())
+register_ranking_api(server, data_store, query_cache, trace_serializer)
+register_export_api(server, data_store)
+register_health_routes(server, data_store)
+if DATA_LOAD_ON_IMPORT:
+    # Returns right away, pages and callbacks serve a placeholder until the data is there
+    data_store.start_background_refresh(DATA_REFRESH_INTERVAL)
+    if SIR_FIT_ENABLED:
+        sir_fit_service.start()
+
+def get_placeholder_layout():
+    # Served until the first data version is loaded, reloads the page once /readyz reports ready
+    return dbc.Jumbotron(
+        id='root',
+        className='container my-5 text-center',
+        children=[
+            html.H1(
+                children=[
+                    "Interactive visualization of covid-19 progression",
+                ],
+            ),
+            html.H3(
+                className='text-muted',
+                children=[
+                    "Loading the latest data from Johns Hopkins University...",
+                ],
+            ),
+            dbc.Spinner(color='warning'),
+            dcc.Interval(id='startup-interval', interval=2000),
+            dcc.Store(id='startup-readiness-url', data='/readyz'),
+            html.Div(id='startup-status', hidden=True),
+        ],
+    )
+
+def get_layout(state):
+    list_of_avaliable_countries, evaluation_options, list_of_available_dates, dfs, data_version = state
+    return dbc.Jumbotron(
+        id='root',
+        className='container my-5',
+        children = [
+            dcc.Location(id='url', refresh=False),        
+            dcc.Store(id='data-version', data=data_version),
+            dcc.Interval(id='data-refresh-interval', interval=max(DATA_REFRESH_INTERVAL, 60) * 1000),
+            html.Div(
+                id='header-information',
+                className='text-center',
+                style={'textAlign': 'center',},
+                children=[
+                    html.H1(
+                        children=[
+                            "Interactive visualization of covid-19 progression",
+                        ],
+                    ),
+                    html.H3(
+                        # className='text-warning',
+                        children=[
+                        "with data from Johns Hopkins University",
+                        ],
+                    ),
+                    dbc.Button(
+                        id='open-info-modal',
+                        className='btn-primary',
+                        children=[
+                            "About this App"
+                        ]
+                    ),                
+                    dbc.Modal(
+                        id='info-modal',
+                        size='xl',
+                        children=[
+                            dbc.ModalHeader(
+                                className='text-center',
+                                children=[
+                                    dcc.Markdown(
+                                        children=JHCCU_TITLE,
+                                    ),
+                                ],    
+                            ),
+                            dbc.ModalBody(
+                                children=[
+                                    dcc.Markdown(JHCCU_INFO_TEXT),
+                                ]
+                            ),
+                            dbc.ModalFooter(
+                                className='text-right',
+                                children=[
+                                    html.Blockquote(
+                                        html.Cite('created by Jan Macenka',)
+                                    ),
+                                    dbc.Button("Close", id="close-info-modal", className="ml-auto"),
+                                ]
+                            ),
+                        ],
+                    ),
+                    html.Hr(
+                        className="my-2"
+                    ),
+                ],
+            ),
+            dcc.Tab(
+                id='data-visualization-tab',
+                label='Data-Visualization',
+                children=[
+                    dbc.Row(
+                        className='my-2',
+                        children=[
+                            dbc.Col(
+                                id='yaxis-settings-col',
+                                children=[
+                                    html.H3(
+                                        className='centered p-2',
+                                        children='Y-axis',
+                                    ),
+                                    dbc.Card(
+                                        className='border-5 rounded py-2 m-2 bg-light',
+                                        children= [        
+                                            html.P(
+                                                className='centered text-muted pt-2',
+                                                children='data',
+                                            ),                                                                 
+                                            dbc.RadioItems(
+                                                id="yaxis-data-selection",
+                                                value= list(dfs.keys())[0],
+                                                className="date-group-items centered pb-2",
+                                                labelClassName="date-group-labels btn btn-warning",
+                                                labelCheckedClassName="date-group-labels-checked",
+                                                inline=True,
+                                                options=[
+                                                    {'value':key, 'label': key} for key in dfs.keys()
+                                                ],
+                                            ),
+                                            html.P(
+                                                className='centered text-muted pt-2',
+                                                children='evaluation',
+                                            ),                                                     
+                                            dbc.RadioItems(
+                                                id='yaxis-data-evaluation',
+                                                value = list(evaluation_options)[0],
+                                                className="date-group-items centered pb-2",
+                                                labelClassName="date-group-labels btn btn-warning",
+                                                labelCheckedClassName="date-group-labels-checked",
+                                                inline=True,
+                                                options=[
+                                                    {'value':key, 'label': key} for key in evaluation_options
+                                                ],
+                                            ),
+                                            html.P(
+                                                className='centered text-muted pt-2',
+                                                children='axis scale',
+                                            ),
+                                            dbc.RadioItems(
+                                                id='yaxis-type',
+                                                value=list(GRAPH_SCALE_OPTIONS.keys())[-1],
+                                                className="date-group-items centered pb-2",
+                                                labelClassName="date-group-labels btn btn-warning",
+                                                labelCheckedClassName="date-group-labels-checked",
+                                                inline=True,
+                                                options=[{'value': value, 'label': label} for value, label in GRAPH_SCALE_OPTIONS.items()],
+                                            ),
+                                            html.P(
+                                                className='centered text-muted pt-2',
+                                                children='number of moving average days',
+                                            ),                                                         
+                                            dbc.RadioItems(
+                                                id='yaxis-averaging-range-slider',
+                                                value=1,
+                                                className="date-group-items centered pb-2",
+                                                labelClassName="date-group-labels btn btn-warning",
+                                                labelCheckedClassName="date-group-labels-checked",
+                                                inline=True,
+                                                options=[{'value': value, 'label': value} for value in range(1,8,1)],
+                                            ),                                                        
+                                        ],
+                                    ),
+                                ],
+                            ),
+                            dbc.Col(
+                                id='xaxis-settings-col',
+                                children=[
+                                    html.H3(
+                                        className='centered p-2',
+                                        children='X-axis',
+                                    ),
+                                    dbc.Card(
+                                        className='border-5 rounded py-2 m-2 bg-light',
+                                        children= [        
+                                            html.P(
+                                                className='centered text-muted pt-2',
+                                                children='data',
+                                            ),                                                                 
+                                            dbc.RadioItems(
+                                                id="xaxis-data-selection",
+                                                value= list(dfs.keys())[-1],
+                                                className="date-group-items centered pb-2",
+                                                labelClassName="date-group-labels btn btn-warning",
+                                                labelCheckedClassName="date-group-labels-checked",
+                                                inline=True,
+                                                options=[
+                                                    {'value':key, 'label': key} for key in dfs.keys()
+                                                ],
+                                            ),
+                                            html.P(
+                                                className='centered text-muted pt-2',
+                                                children='evaluation',
+                                            ),                                                     
+                                            dbc.RadioItems(
+                                                id='xaxis-data-evaluation',
+                                                value = list(evaluation_options)[0],
+                                                className="date-group-items centered pb-2",
+                                                labelClassName="date-group-labels btn btn-warning",
+                                                labelCheckedClassName="date-group-labels-checked",
+                                                inline=True,
+                                                options=[
+                                                    {'value':key, 'label': key} for key in evaluation_options
+                                                ],
+                                            ),
+                                            html.P(
+                                                className='centered text-muted pt-2',
+                                                children='axis scale',
+                                            ),
+                                            dbc.RadioItems(
+                                                id='xaxis-type',
+                                                value=list(GRAPH_SCALE_OPTIONS.keys())[-1],
+                                                className="date-group-items centered pb-2",
+                                                labelClassName="date-group-labels btn btn-warning",
+                                                labelCheckedClassName="date-group-labels-checked",
+                                                inline=True,
+                                                options=[{'value': value, 'label': label} for value, label in GRAPH_SCALE_OPTIONS.items()],
+                                            ),
+                                            html.P(
+                                                className='centered text-muted pt-2',
+                                                children='number of moving average days',
+                                            ),                                                         
+                                            dbc.RadioItems(
+                                                id='xaxis-averaging-range-slider',
+                                                value=1,
+                                                className="date-group-items centered pb-2",
+                                                labelClassName="date-group-labels btn btn-warning",
+                                                labelCheckedClassName="date-group-labels-checked",
+                                                inline=True,
+                                                options=[{'value': value, 'label': value} for value in range(1,8,1)],
+                                            ),                                                       
+                                        ],
+                                    ),
+                                ],
+                            ),                                        
+                        ],
+                    ),
+                    html.P(
+                        className='centered text-muted pt-2',
+                        children='country selection',
+                    ),                            
+                    dcc.Dropdown(
+                        id='country-selection',
+                        value = INITIAL_COUNTRIES,
+                        placeholder='Select some countries...',
+                        multi=True,
+                        className='m-2',
+                        persistence=True,
+                        options=get_region_options(dfs, INITIAL_COUNTRIES),
+                    ),
+                    html.Div(
+                        id='data-visualitaion-graph',
+                        children=[
+                            dcc.Store(id='graph-series'),
+                            dcc.Store(id='graph-series-delta'),
+                            dcc.Store(id='graph-series-held'),
+                            dcc.Graph(id='covid-graph', className='spaced', figure={}),
+                        ] if CLIENTSIDE_GRAPH else ['populated by callback'],
+                    ),
+                    dcc.RangeSlider(
+                        id='date-range-slider',
+                        className='mb-5 pb-2 mx-2',
+                        updatemode='drag',
+                        min=0,
+                        max=(len(list_of_available_dates) - 1),
+                        count=1,
+                        step=1,
+                        allowCross=True,
+                        pushable=2,
+                        value=[0, (len(list_of_available_dates) - 1)],
+                        marks=get_cached_slider_marks(state),
+                        persistence=True,
+                    ),
+                ],
+            ),
+            html.Div(
+                id='ranking-section',
+                children=[
+                    html.H3(
+                        className='centered p-2',
+                        children='Ranking',
+                    ),
+                    dbc.Card(
+                        className='border-5 rounded py-2 m-2 bg-light',
+                        children=[
+                            html.P(
+                                className='centered text-muted pt-2',
+                                children='data',
+                            ),
+                            dbc.RadioItems(
+                                id='ranking-data-selection',
+                                value=list(dfs.keys())[0],
+                                className="date-group-items centered pb-2",
+                                labelClassName="date-group-labels btn btn-warning",
+                                labelCheckedClassName="date-group-labels-checked",
+                                inline=True,
+                                options=[
+                                    {'value':key, 'label': key} for key in dfs.keys() if key != 'time'
+                                ],
+                            ),
+                            html.P(
+                                className='centered text-muted pt-2',
+                                children='evaluation',
+                            ),
+                            dbc.RadioItems(
+                                id='ranking-data-evaluation',
+                                value='daily cases normalized',
+                                className="date-group-items centered pb-2",
+                                labelClassName="date-group-labels btn btn-warning",
+                                labelCheckedClassName="date-group-labels-checked",
+                                inline=True,
+                                options=[
+                                    {'value':key, 'label': key} for key in evaluation_options
+                                ],
+                            ),
+                            html.P(
+                                className='centered text-muted pt-2',
+                                children='number of moving average days',
+                            ),
+                            dbc.RadioItems(
+                                id='ranking-averaging-days',
+                                value=7,
+                                className="date-group-items centered pb-2",
+                                labelClassName="date-group-labels btn btn-warning",
+                                labelCheckedClassName="date-group-labels-checked",
+                                inline=True,
+                                options=[{'value': value, 'label': value} for value in range(1,8,1)],
+                            ),
+                            html.P(
+                                className='centered text-muted pt-2',
+                                children='regions',
+                            ),
+                            dbc.RadioItems(
+                                id='ranking-level',
+                                value=REGION_LEVELS[0],
+                                className="date-group-items centered pb-2",
+                                labelClassName="date-group-labels btn btn-warning",
+                                labelCheckedClassName="date-group-labels-checked",
+                                inline=True,
+                                options=[{'value': value, 'label': value} for value in REGION_LEVELS],
+                            ),
+                            dbc.Row(
+                                className='centered m-2',
+                                children=[
+                                    dbc.Col(children=['top ', dcc.Input(id='ranking-size', type='number', min=1, max=RANKING_MAX_RESULTS, step=1, value=10, debounce=True)]),
+                                    dbc.Col(children=['over the last ', dcc.Input(id='ranking-last-days', type='number', min=1, step=1, value=14, debounce=True), ' days']),
+                                    dbc.Col(children=[dbc.Button(id='ranking-plot-button', className='btn-primary', children='Show in graph')]),
+                                ],
+                            ),
+                        ],
+                    ),
+                    dash_table.DataTable(
+                        id='ranking-table',
+                        columns=[
+                            {'id':'rank', 'name':'#'},
+                            {'id':'region', 'name':'region'},
+                            {'id':'score', 'name':'average over the last days'},
+                            {'id':'latest', 'name':'latest day'},
+                        ],
+                        data=[],
+                        style_cell={'textAlign':'left'},
+                        style_table={'margin':'0.5rem'},
+                    ),
+                ],
+            ),
+            html.Footer(
+                id='footer-information',
+                className='text-muted border-top text-center pt-2',
+                children=[
+                    dcc.Link(
+                        id='github-repo-link',
+                        href='https://github.com/jmacenka/dash-covid-19-visualization',
+                        children=[
+                            'App source code',
+                        ],
+                    ),
+                    html.Br(),
+                    html.A(
+                        id='footer-email-to-developer',
+                        href='mailto:corona.macenka.de@gmx.net',
+                        children=[
+                            'Email to developer'
+                        ],
+                    ),
+                    html.Br(),
+                    'App by Jan Macenka - 29.03.2020',
+                ]    
+            ),
         
-    ],
+        ],
+    )
+
+def serve_layout():
+    state = data_store.current
+    if state is None:
+        return get_placeholder_layout()
+    return get_layout(state)
+
+app.layout = serve_layout
+
+app.clientside_callback(
+    ClientsideFunction('startup', 'reload_when_ready'),
+    Output('startup-status','children'),
+    [Input('startup-interval','n_intervals'),],
+    [State('startup-readiness-url','data'),],
 )
 
 @app.callback(
@@ -392,25 +627,119 @@ app.layout = dbc.Jumbotron(
     [State("info-modal", "is_open")],
 )
 def toggle_modal(n_open, n_close, is_open):
-    # global list_of_avaliable_countries, evaluation_options, list_of_available_dates, dfs
-    # list_of_avaliable_countries, evaluation_options, list_of_available_dates, dfs = generate_dataframes_dict()
     if n_open or n_close:
         return not is_open
     return is_open
 
 @app.callback(
-    [Output('data-visualitaion-graph','children'),],
-    [Input('country-selection','value'),
-    Input('date-range-slider','value'),
-    Input('yaxis-type','value'),
-    Input('xaxis-type','value'),
-    Input('yaxis-data-selection','value'),
-    Input('xaxis-data-selection','value'),
-    Input('yaxis-data-evaluation','value'),
-    Input('xaxis-data-evaluation','value'),
-    Input('yaxis-averaging-range-slider','value'),
-    Input('xaxis-averaging-range-slider','value'),],    
+    [Output('date-range-slider','max'),
+    Output('date-range-slider','marks'),
+    Output('date-range-slider','value'),
+    Output('data-version','data'),],
+    [Input('data-refresh-interval','n_intervals'),],
+    [State('data-version','data'),
+    State('date-range-slider','value'),
+    State('date-range-slider','max'),],
+)
+@timed(CALLBACK_SECONDS, callback='refresh_data_selection')
+def refresh_data_selection(n_intervals, data_version, range_slider_value, range_slider_max):
+    # Pages opened before a data refresh pick up the new dates and countries
+    state = current_state()
+    if state.version == data_version:
+        raise PreventUpdate
+    new_max = len(state.dates) - 1
+    if not range_slider_value or range_slider_max is None:
+        range_slider_value = [0, new_max]
+    elif range_slider_value[-1] >= range_slider_max:
+        # Keep following the latest day if the slider was pinned to it
+        range_slider_value = [range_slider_value[0], new_max]
+    return (
+        new_max,
+        get_cached_slider_marks(state),
+        [min(value, new_max) for value in range_slider_value],
+        state.version,
+    )
+
+@app.callback(
+    Output('country-selection','options'),
+    [Input('data-version','data'),
+    Input('country-selection','value'),],
 )
+@timed(CALLBACK_SECONDS, callback='update_country_options')
+def update_country_options(data_version, country_selection_value):
+    return get_region_options(current_state().dfs, country_selection_value)
+
+@app.callback(
+    Output('ranking-table','data'),
+    [Input('ranking-data-selection','value'),
+    Input('ranking-data-evaluation','value'),
+    Input('ranking-averaging-days','value'),
+    Input('ranking-level','value'),
+    Input('ranking-size','value'),
+    Input('ranking-last-days','value'),
+    Input('data-version','data'),],
+)
+@timed(CALLBACK_SECONDS, callback='update_ranking_table')
+def update_ranking_table(selection, evaluation, averaging_days, level, size, last_days, data_version):
+    state = current_state()
+    try:
+        arguments = parse_query_arguments(dict(selection=selection, evaluation=evaluation, averaging_days=averaging_days, level=level, n=size, last_days=last_days), state.dfs, 'ranking')
+    except ValueError:
+        raise PreventUpdate
+    ranking = get_ranking(state, query_cache, arguments)['ranking']
+    scores = trace_serializer.encode_values([row['score'] for row in ranking])
+    latest = trace_serializer.encode_values([row['latest'] if row['latest'] is not None else float('nan') for row in ranking])
+    return [dict(row, score=score, latest=value) for row, score, value in zip(ranking, scores, latest)]
+
+@app.callback(
+    Output('country-selection','value'),
+    [Input('ranking-plot-button','n_clicks'),],
+    [State('ranking-table','data'),],
+)
+@timed(CALLBACK_SECONDS, callback='show_ranking_in_graph')
+def show_ranking_in_graph(n_clicks, ranking_table_data):
+    if not n_clicks or not ranking_table_data:
+        raise PreventUpdate
+    return [row['region'] for row in ranking_table_data]
+
+@timed(CALLBACK_SECONDS, callback='update_graph_series')
+def update_graph_series(country_selection_value, 
+                yaxis_data_selection_value,
+                xaxis_data_selection_value,
+                yaxis_data_evaluation_value,
+                xaxis_data_evaluation_value,
+                data_version,
+                held_series,
+                ):
+    # Only runs when countries or datasets change, everything else is handled by the clientside callback.
+    # Sends the full series on the first render and for new data, afterwards only the delta to what the browser holds
+    if country_selection_value is None:
+        raise PreventUpdate
+    state = current_state()
+    env_variables = dict(
+            country_selection_value=country_selection_value, 
+            yaxis_data_selection_value=yaxis_data_selection_value, 
+            xaxis_data_selection_value=xaxis_data_selection_value, 
+            yaxis_data_evaluation_value=yaxis_data_evaluation_value, 
+            xaxis_data_evaluation_value=xaxis_data_evaluation_value, 
+        )
+    held = get_held_series(state.version, **env_variables)
+    if held == held_series:
+        raise PreventUpdate
+    if held_series is None or held_series.get('version') != state.version:
+        series = figure_cache.get_or_build(
+            figure_cache.make_series_key(state.version, **env_variables),
+            lambda: build_graph_series(dfs=state.dfs, **env_variables),
+        )
+        delta = {'reset':True, 'series':series}
+    else:
+        delta = build_graph_series_delta(held_series, dfs=state.dfs, **env_variables)
+    return (
+        delta,
+        held,
+    )
+
+@timed(CALLBACK_SECONDS, callback='update_data_visualitaion_graph')
 def update_data_visualitaion_graph(country_selection_value, 
                 range_slider_value, 
                 yaxis_type_value, 
@@ -424,6 +753,7 @@ def update_data_visualitaion_graph(country_selection_value,
                 ):
     if country_selection_value is None:
         raise PreventUpdate
+    state = current_state()
     env_variables = dict(
             country_selection_value=country_selection_value, 
             range_slider_value=range_slider_value, 
@@ -437,12 +767,70 @@ def update_data_visualitaion_graph(country_selection_value,
             xaxis_averaging_days=xaxis_averaging_days,
         )
     
-    graph = build_graph(**env_variables)
+    # Figures are cached per data version, repeated views (e.g. while dragging the slider) skip pandas entirely
+    graph = figure_cache.get_or_build(
+        figure_cache.make_key(state.version, **env_variables),
+        lambda: build_graph(dfs=state.dfs, **env_variables),
+    )
     
     return (
         graph,     
     )
 
+if CLIENTSIDE_GRAPH:
+    app.callback(
+        [Output('graph-series-delta','data'),
+        Output('graph-series-held','data'),],
+        [Input('country-selection','value'),
+        Input('yaxis-data-selection','value'),
+        Input('xaxis-data-selection','value'),
+        Input('yaxis-data-evaluation','value'),
+        Input('xaxis-data-evaluation','value'),
+        Input('data-version','data'),],
+        [State('graph-series-held','data'),],
+    )(update_graph_series)
+    app.clientside_callback(
+        ClientsideFunction('graph', 'merge_series'),
+        Output('graph-series','data'),
+        [Input('graph-series-delta','data'),],
+        [State('graph-series','data'),],
+    )
+    app.clientside_callback(
+        ClientsideFunction('graph', 'render_figure'),
+        Output('covid-graph','figure'),
+        [Input('graph-series','data'),
+        Input('date-range-slider','value'),
+        Input('yaxis-type','value'),
+        Input('xaxis-type','value'),
+        Input('yaxis-averaging-range-slider','value'),
+        Input('xaxis-averaging-range-slider','value'),],
+    )
+else:
+    app.callback(
+        [Output('data-visualitaion-graph','children'),],
+        [Input('country-selection','value'),
+        Input('date-range-slider','value'),
+        Input('yaxis-type','value'),
+        Input('xaxis-type','value'),
+        Input('yaxis-data-selection','value'),
+        Input('xaxis-data-selection','value'),
+        Input('yaxis-data-evaluation','value'),
+        Input('xaxis-data-evaluation','value'),
+        Input('yaxis-averaging-range-slider','value'),
+        Input('xaxis-averaging-range-slider','value'),],    
+    )(update_data_visualitaion_graph)
+
+if METRICS_ENABLED:
+    instrument_callbacks(app)
+    instrument_server(server)
+    REGISTRY.gauge('covid_figure_cache_entries', 'Figures held in the figure cache', lambda: {(): figure_cache.stats()['size']})
+    REGISTRY.gauge('covid_figure_cache_hits_total', 'Figure cache hits', lambda: {(): figure_cache.stats()['hits']}, metric_type='counter')
+    REGISTRY.gauge('covid_figure_cache_misses_total', 'Figure cache misses', lambda: {(): figure_cache.stats()['misses']}, metric_type='counter')
+    REGISTRY.gauge('covid_data_days', 'Days in the current data version', lambda: {(state.version,): len(state.dates) for state in [data_store.current] if state is not None}, ['version'])
+    REGISTRY.gauge('covid_data_countries', 'Countries in the current data version', lambda: {(state.version,): len(state.countries) for state in [data_store.current] if state is not None}, ['version'])
+# Registered after the metrics hook so the byte counts are those sent on the wire
+init_http_caching(server, app)
+init_profiling(server)
 
 # Extract the Flask-Server for gunicorn
 server = app.server
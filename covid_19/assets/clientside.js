@@ -0,0 +1,153 @@
+/* START Clientside graph rendering START */
+
+/*
+ * The server ships the full, unsmoothed series of the selected countries once and
+ * afterwards only deltas (added countries, changed axes), merged into the
+ * 'graph-series' store here. Date windowing, moving averages and axis scales are
+ * applied here, mirroring build_graph in app.py, without a server round trip.
+ */
+
+function movingAverage(values, nDays) {
+    // Same as pandas rolling(nDays).mean(): windows containing missing values are null
+    if (nDays <= 1) {
+        return values;
+    }
+    var result = new Array(values.length).fill(null);
+    var sum = 0;
+    var missing = 0;
+    for (var idx = 0; idx < values.length; idx++) {
+        if (values[idx] === null) {
+            missing++;
+        } else {
+            sum += values[idx];
+        }
+        if (idx >= nDays) {
+            if (values[idx - nDays] === null) {
+                missing--;
+            } else {
+                sum -= values[idx - nDays];
+            }
+        }
+        if (idx >= nDays - 1 && missing === 0) {
+            result[idx] = sum / nDays;
+        }
+    }
+    return result;
+}
+
+function axisTraces(series, axis, rangeStart, rangeEnd, averagingDays) {
+    var dates = series.dates.slice(rangeStart, rangeEnd);
+    if (axis.values === null) {
+        return series.countries.map(function () { return dates; });
+    }
+    return axis.values.map(function (values) {
+        return movingAverage(values.slice(rangeStart, rangeEnd), averagingDays);
+    });
+}
+
+function axisSettings(series, axis, typeValue, averagingDays) {
+    var title = String(axis.selection);
+    var type = 'lin';
+    if (axis.values !== null) {
+        type = typeValue;
+        if (averagingDays > 1) {
+            title += ' with moving average of ' + averagingDays + ' days';
+        }
+    }
+    title += '<br>[' + axis.unit + ']';
+    return {title: title, type: type, label: series.scale_options[type].toLowerCase()};
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    graph: {
+        merge_series: function (delta, series) {
+            // Applies a 'graph-series-delta' from the server to the held series: a reset replaces them,
+            // otherwise the added countries' values are spliced in and axes whose dataset changed are replaced
+            if (!delta) {
+                return series || null;
+            }
+            if (delta.reset || !series) {
+                return delta.series || null;
+            }
+            var held = {};
+            series.countries.forEach(function (country, idx) {
+                held[country] = idx;
+            });
+            var added = {};
+            delta.added.forEach(function (country, idx) {
+                added[country] = idx;
+            });
+            function mergeAxis(axis, axisDelta) {
+                if (axisDelta.reset) {
+                    return axisDelta;
+                }
+                if (axis.values === null) {
+                    return axis;
+                }
+                return Object.assign({}, axis, {
+                    values: delta.countries.map(function (country) {
+                        return country in added ? axisDelta.values[added[country]] : axis.values[held[country]];
+                    }),
+                });
+            }
+            return Object.assign({}, series, {
+                countries: delta.countries,
+                yaxis: mergeAxis(series.yaxis, delta.yaxis),
+                xaxis: mergeAxis(series.xaxis, delta.xaxis),
+            });
+        },
+        render_figure: function (series, rangeSliderValue, yaxisTypeValue, xaxisTypeValue, yaxisAveragingDays, xaxisAveragingDays) {
+            if (!series || !series.countries.length) {
+                return {data: [], layout: {}};
+            }
+            var rangeStart = rangeSliderValue[0];
+            var rangeEnd = rangeSliderValue[rangeSliderValue.length - 1];
+            var ys = axisTraces(series, series.yaxis, rangeStart, rangeEnd, yaxisAveragingDays);
+            var xs = axisTraces(series, series.xaxis, rangeStart, rangeEnd, xaxisAveragingDays);
+            var yaxis = axisSettings(series, series.yaxis, yaxisTypeValue, yaxisAveragingDays);
+            var xaxis = axisSettings(series, series.xaxis, xaxisTypeValue, xaxisAveragingDays);
+            return {
+                data: series.countries.map(function (country, idx) {
+                    return {
+                        x: xs[idx],
+                        y: ys[idx],
+                        mode: 'line',
+                        opacity: .7,
+                        marker: {size: 15, line: {width: .5}},
+                        name: country,
+                    };
+                }),
+                layout: {
+                    xaxis: {title: xaxis.title, type: xaxis.type},
+                    yaxis: {title: yaxis.title, type: yaxis.type},
+                    padding: {l: 40, b: 40, t: 70, r: 10, pad: 10},
+                    legend: {x: 0, y: 1},
+                    title: series.yaxis.selection + ' (' + yaxis.label + ') vs ' + series.xaxis.selection.toLowerCase() + ' (' + xaxis.label + ')',
+                    hovermode: 'closest',
+                },
+            };
+        },
+    },
+});
+
+/* END Clientside graph rendering END */
+
+/* START Startup placeholder START */
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    startup: {
+        reload_when_ready: function (n_intervals, readinessUrl) {
+            // The placeholder page polls the readiness route and reloads into the dashboard once data is loaded
+            if (n_intervals) {
+                fetch(readinessUrl, {cache: 'no-store'}).then(function (response) {
+                    if (response.ok) {
+                        window.location.reload();
+                    }
+                });
+            }
+            return '';
+        },
+    },
+});
+
+/* END Startup placeholder END */
@@ -0,0 +1,46 @@
+# Run from the covid_19 directory: python -m benchmarks.bench_compression
+import json, gzip
+from plotly.utils import PlotlyJSONEncoder
+
+from benchmarks.common import load_app, best_of
+from benchmarks.bench_serialization import GRAPH_ARGUMENTS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVELS = [1, 3, 6, 9]
+BROTLI_QUALITIES = [1, 4, 6, 9, 11]
+
+def get_payloads(app, n_days):
+    # Bytes of the responses the browser fetches: the server side figure for many countries over the full
+    # date range, the cached layout and the dependencies
+    state = app.data_store.current
+    client = app.server.test_client()
+    countries = [country for country in state.countries if country not in state.dfs.regions.parents]
+    payloads = {}
+    for n_countries in [50, 190]:
+        graph = app.build_graph(countries[:n_countries], [0, n_days - 1], dfs=state.dfs, **GRAPH_ARGUMENTS)
+        payloads[f'figure {n_countries}'] = json.dumps({'response':{'data-visualitaion-graph':{'children':graph}}}, cls=PlotlyJSONEncoder).encode('utf-8')
+    payloads['layout'] = client.get('/_dash-layout', headers={'Accept-Encoding':'identity'}).data
+    payloads['dependencies'] = client.get('/_dash-dependencies', headers={'Accept-Encoding':'identity'}).data
+    return payloads
+
+def main():
+    # Bytes on the wire and CPU time per compression level, the defaults are gzip 6 / brotli 4 per request and
+    # gzip 9 / brotli 9 for bodies compressed once per content
+    n_days = 3 * 365
+    app = load_app(n_countries=190, n_days=n_days)
+    codecs = [(f'gzip {level}', lambda body, level=level: gzip.compress(body, level)) for level in GZIP_LEVELS]
+    if brotli is not None:
+        codecs += [(f'br {quality}', lambda body, quality=quality: brotli.compress(body, quality=quality)) for quality in BROTLI_QUALITIES]
+    print(f'{"payload":>13} {"encoding":>9} {"size [KiB]":>11} {"ratio":>6} {"compress [ms]":>14}')
+    for name, body in get_payloads(app, n_days).items():
+        print(f'{name:>13} {"identity":>9} {len(body)/1024:>11.1f} {1:>6.2f} {0:>14.2f}')
+        for codec, compress in codecs:
+            seconds, compressed = best_of(compress, body, repeat=3)
+            print(f'{name:>13} {codec:>9} {len(compressed)/1024:>11.1f} {len(body)/len(compressed):>6.2f} {seconds*1000:>14.2f}')
+
+if __name__ == '__main__':
+    main()
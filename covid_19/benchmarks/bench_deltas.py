@@ -0,0 +1,32 @@
+# Run from the covid_19 directory: python -m benchmarks.bench_deltas
+import json
+from plotly.utils import PlotlyJSONEncoder
+
+from benchmarks.common import load_app, best_of
+
+SERIES_ARGUMENTS = dict(
+    yaxis_data_selection_value='confirmed',
+    xaxis_data_selection_value='deaths',
+    yaxis_data_evaluation_value='daily cases',
+    xaxis_data_evaluation_value='cases',
+)
+
+def main():
+    # Adding one country to n selected ones: the full series as before versus the delta to what the browser holds
+    app = load_app(n_countries=190, n_days=365)
+    state = app.data_store.current
+    countries = [country for country in state.countries if country not in state.dfs.regions.parents]
+    print(f'{"selected":>9} {"update":>7} {"build [ms]":>11} {"payload [KiB]":>14}')
+    for n_countries in [5, 20, 80]:
+        held = app.get_held_series(state.version, countries[:n_countries], **SERIES_ARGUMENTS)
+        selection = countries[:n_countries + 1]
+        for name, build in [
+            ('full', lambda: app.build_graph_series(selection, dfs=state.dfs, **SERIES_ARGUMENTS)),
+            ('delta', lambda: app.build_graph_series_delta(held, selection, dfs=state.dfs, **SERIES_ARGUMENTS)),
+        ]:
+            seconds, result = best_of(build)
+            payload = json.dumps(result, cls=PlotlyJSONEncoder)
+            print(f'{n_countries:>9} {name:>7} {seconds*1000:>11.2f} {len(payload)/1024:>14.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+# Run from the covid_19 directory: python -m benchmarks.bench_ingest
+import io, os, tracemalloc
+import pandas as pd
+
+from benchmarks.common import best_of
+from benchmarks.fixtures import write_jhu_fixture, write_jhu_us_fixture
+from data_api.ingest import aggregate_time_series
+
+def ingest_legacy(content:bytes, group_column:str):
+    # What generate_dataframes_dict did before: default inference, then group, drop and transpose
+    df = pd.read_csv(io.BytesIO(content))
+    df = df.groupby(group_column).agg('sum').drop(['Lat','Long'], axis=1, errors='ignore').T
+    df = df.loc[[column for column in df.index if '/' in str(column)]]
+    df.index = pd.to_datetime(df.index, infer_datetime_format=True)
+    return df.astype('float64')
+
+def measure(func, *args):
+    seconds, _ = best_of(func, *args, repeat=3)
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+def main():
+    cases = [
+        ('global 190 countries', os.path.join(write_jhu_fixture(n_countries=190, n_days=1000), 'time_series_covid19_confirmed_global.csv'), 'Country/Region', ('Country/Region',)),
+        ('provinces 190 x 20', os.path.join(write_jhu_fixture(n_countries=190, n_days=1000, n_provinces=20), 'time_series_covid19_confirmed_global.csv'), 'Country/Region', ('Country/Region',)),
+        ('US counties 50 x 650', os.path.join(write_jhu_us_fixture(n_states=50, n_counties=650, n_days=1000), 'time_series_covid19_confirmed_US.csv'), 'Province_State', ('Province/State',)),
+    ]
+    print(f'{"file (1000 days)":>22} {"rows":>7} {"MiB":>6} {"implementation":>15} {"time [ms]":>10} {"peak [MiB]":>11}')
+    for name, path, legacy_group_column, group_columns in cases:
+        with open(path, 'rb') as csv_file:
+            content = csv_file.read()
+        n_rows = content.count(b'\n') - 1
+        for implementation, func, args in [('legacy', ingest_legacy, (content, legacy_group_column)), ('streaming', aggregate_time_series, (content, group_columns))]:
+            seconds, peak = measure(func, *args)
+            print(f'{name:>22} {n_rows:>7} {len(content)/2**20:>6.1f} {implementation:>15} {seconds*1000:>10.1f} {peak/2**20:>11.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+# Run from the covid_19 directory: python -m benchmarks.bench_layout
+import json
+import plotly
+
+from benchmarks.common import load_app, best_of
+
+def get_slider_marks_legacy(dates_list, num_marks=15):
+    # The per date loop get_slider_marks used before
+    mark_stepsize = len(dates_list) // num_marks
+    dates = {}
+    for idx, date in enumerate(dates_list):
+        if date.day == 1 or idx == 0:
+            dates[idx] = {'label':date.strftime('%b'), 'style':{'font-weight': 'bold','size':'5px', 'transform': 'rotate(70deg)'}}
+        elif date.day % mark_stepsize == 0:
+            dates[idx] = str(date.day)
+        else:
+            dates[idx] = ''
+    return dates
+
+def main():
+    print(f'{"days":>6} {"marks loop [ms]":>16} {"marks [ms]":>11} {"render [ms]":>12} {"cached [ms]":>12} {"JSON [KiB]":>11} {"gzip [KiB]":>11}')
+    for n_days in [365, 3 * 365, 6 * 365]:
+        app = load_app(n_countries=190, n_days=n_days)
+        state = app.data_store.current
+        client = app.server.test_client()
+        loop_seconds, _ = best_of(get_slider_marks_legacy, state.dates)
+        marks_seconds, _ = best_of(app.get_slider_marks, state.dates)
+        # Rendering the layout per request, as /_dash-layout did before, versus serving the cached rendering
+        render_seconds, body = best_of(lambda: json.dumps(app.get_layout(state), cls=plotly.utils.PlotlyJSONEncoder))
+        client.get('/_dash-layout')
+        cached_seconds, response = best_of(lambda: client.get('/_dash-layout', headers={'Accept-Encoding':'gzip'}), repeat=20)
+        print(f'{n_days:>6} {loop_seconds*1000:>16.2f} {marks_seconds*1000:>11.2f} {render_seconds*1000:>12.2f} {cached_seconds*1000:>12.2f} {len(body)/1024:>11.1f} {len(response.data)/1024:>11.1f}')
+
+if __name__ == '__main__':
+    main()
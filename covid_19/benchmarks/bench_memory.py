@@ -0,0 +1,48 @@
+# Run from the covid_19 directory: python -m benchmarks.bench_memory
+import gc, tracemalloc
+
+from benchmarks.common import load_app, best_of
+from data_api.evaluations import DatasetTree, EVALUATIONS, STORAGE_MODES, TIME_SELECTION
+
+def build_tree(base_frames, country_population_dict, storage, cache_size):
+    # Copies the input so the frames storage pays for its own frames, like after a download
+    return DatasetTree({selection: df.copy() for selection, df in base_frames.items()}, country_population_dict, cache_size=cache_size, storage=storage)
+
+def touch(dfs, evaluations):
+    for selection in dfs:
+        if selection != TIME_SELECTION:
+            for evaluation in evaluations:
+                dfs.get_data(selection, evaluation)
+
+def footprint(base_frames, country_population_dict, storage, cache_size, evaluations):
+    gc.collect()
+    tracemalloc.start()
+    dfs = build_tree(base_frames, country_population_dict, storage, cache_size)
+    touch(dfs, evaluations)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dfs, current, peak
+
+def cross_country_total(dfs):
+    # A cross-country reduction over every date, e.g. for rankings or aggregates
+    return dfs['confirmed']['daily cases']['data'].to_numpy().sum(axis=1)
+
+def main():
+    print(f'{"days":>6} {"storage":>8} {"scenario":>18} {"resident [MiB]":>15} {"peak [MiB]":>11} {"total [ms]":>11}')
+    for n_days in [365, 1100]:
+        app = load_app(n_countries=190, n_days=n_days)
+        dfs = app.data_store.current.dfs
+        base_frames, country_population_dict = dfs.base_frames, dfs.country_population_dict
+        n_selections = len(dfs.selections)
+        for scenario, evaluations, cache_size in [
+            ('cumulative only', ['cases'], len(EVALUATIONS) * n_selections),
+            ('all evaluations', list(EVALUATIONS), len(EVALUATIONS) * n_selections),
+        ]:
+            for storage in STORAGE_MODES:
+                tree, current, peak = footprint(base_frames, country_population_dict, storage, cache_size, evaluations)
+                seconds, _ = best_of(cross_country_total, tree)
+                print(f'{n_days:>6} {storage:>8} {scenario:>18} {current/2**20:>15.2f} {peak/2**20:>11.2f} {seconds*1000:>11.3f}')
+                del tree
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# Run from the covid_19 directory: python -m benchmarks.bench_normalization
+import time, tracemalloc
+import numpy as np
+import pandas as pd
+
+from data_api.evaluations import normalize_by_population
+
+def normalize_by_population_loop(df, country_population_dict):
+    # The per-column implementation that normalize_by_population replaced
+    available_country_population = set(country_population_dict.keys())
+    df_normalized = pd.DataFrame()
+    for country in df.columns:
+        c = country.lower()
+        if c in available_country_population:
+            country_population = country_population_dict.get(c)
+            df_normalized[country] = df[country] / (country_population/100)
+        else:
+            df_normalized[country] = pd.Series([0 for _ in df.index])
+    return df_normalized
+
+def build_input(n_countries, n_days):
+    countries = [f'Country {idx}' for idx in range(n_countries)]
+    df = pd.DataFrame(np.random.default_rng(0).integers(0, 10**6, size=(n_days, n_countries)).astype('float64'),
+        index=pd.date_range('2020-01-22', periods=n_days), columns=countries)
+    # Leave every tenth country without population, like 'World'
+    country_population_dict = {country.lower():10**7 for idx, country in enumerate(countries) if idx % 10}
+    return df, country_population_dict
+
+def measure(func, *args, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(timings), peak
+
+def main():
+    print(f'{"countries":>10} {"days":>6} {"implementation":>15} {"time [ms]":>10} {"peak [MiB]":>11}')
+    for n_countries, n_days in [(190, 120), (190, 365), (190, 1000), (2000, 365)]:
+        df, country_population_dict = build_input(n_countries, n_days)
+        for name, func in [('loop', normalize_by_population_loop), ('vectorized', normalize_by_population)]:
+            seconds, peak = measure(func, df, country_population_dict)
+            print(f'{n_countries:>10} {n_days:>6} {name:>15} {seconds*1000:>10.2f} {peak/2**20:>11.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+# Run from the covid_19 directory: python -m benchmarks.bench_pipeline
+# Hot paths of the dashboard against growing synthetic inputs, compare the table before and after a change
+from benchmarks.common import load_app, best_of
+from benchmarks.bench_rolling import build_full_graph
+
+# (countries, days) of the synthetic JHU data, 190 x 365 is about the size of the real data in early 2021
+SCALES = [(50, 120), (190, 365), (190, 1100), (500, 365)]
+GRAPH_COUNTRIES = 10
+
+def main():
+    print(f'{"countries":>10} {"days":>6} {"generate [ms]":>14} {"build_graph [ms]":>17} {"slider marks [ms]":>18} {"SIR [ms]":>9}')
+    for n_countries, n_days in SCALES:
+        app = load_app(n_countries=n_countries, n_days=n_days)
+        # Import after load_app, which reloads the modules against the fixture
+        from data_api.apis import generate_dataframes_dict
+        state = app.data_store.current
+        countries = list(state.countries[:GRAPH_COUNTRIES])
+        range_slider_value = [0, len(state.dates) - 1]
+        generate, _ = best_of(generate_dataframes_dict, repeat=3)
+        # Warm, the rolling index of the frame is built in the first run
+        graph, _ = best_of(build_full_graph, app, state.dfs, countries, range_slider_value, 7)
+        marks, _ = best_of(app.get_slider_marks, state.dates)
+        sir, _ = best_of(app.SIR, 8.3e7, 100, 3e-9, .1, n_days, repeat=3)
+        print(f'{n_countries:>10} {n_days:>6} ' + ' '.join(f'{seconds*1000:>{width}.2f}' for seconds, width in zip([generate, graph, marks, sir], [14, 17, 18, 9])))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# Run from the covid_19 directory: python -m benchmarks.bench_rolling
+from benchmarks.common import load_app, best_of
+from figures.rolling import select_block, moving_average, RollingIndex
+
+def smooth_per_country(app, dfs, countries, range_slider_value, averaging_days):
+    # What build_graph did before: two lookups and two rolling means per country
+    return [(
+        app.get_country_data_df(dfs, 'confirmed', 'daily cases', country, range_slider_value).rolling(averaging_days).mean(),
+        app.get_country_data_df(dfs, 'deaths', 'daily cases', country, range_slider_value).rolling(averaging_days).mean(),
+    ) for country in countries]
+
+def smooth_batched(app, dfs, countries, range_slider_value, averaging_days):
+    return (
+        moving_average(select_block(dfs['confirmed']['daily cases']['data'], countries, range_slider_value), averaging_days),
+        moving_average(select_block(dfs['deaths']['daily cases']['data'], countries, range_slider_value), averaging_days),
+    )
+
+def smooth_indexed(app, dfs, countries, range_slider_value, averaging_days):
+    return (
+        app.rolling_indexes.get(dfs['confirmed']['daily cases']['data']).moving_average(countries, range_slider_value, averaging_days),
+        app.rolling_indexes.get(dfs['deaths']['daily cases']['data']).moving_average(countries, range_slider_value, averaging_days),
+    )
+
+def build_full_graph(app, dfs, countries, range_slider_value, averaging_days):
+    return app.build_graph(countries, range_slider_value, 'confirmed', 'deaths', 'daily cases', 'daily cases', 'log', 'log', averaging_days, averaging_days, dfs=dfs)
+
+def main():
+    app = load_app(n_countries=190, n_days=730)
+    state = app.data_store.current
+    range_slider_value = [0, len(state.dates) - 1]
+    print(f'{"countries":>10} {"per-country [ms]":>17} {"batched [ms]":>13} {"indexed [ms]":>13} {"build_graph [ms]":>17}')
+    for n_countries in [1, 10, 30, 100, 190]:
+        countries = list(state.countries[:n_countries])
+        timings = [best_of(func, app, state.dfs, countries, range_slider_value, 7)[0] for func in [smooth_per_country, smooth_batched, smooth_indexed, build_full_graph]]
+        print(f'{n_countries:>10} ' + ' '.join(f'{seconds*1000:>{width}.2f}' for seconds, width in zip(timings, [17, 13, 13, 17])))
+
+    # Latency of the last 60 days of 30 countries while the history grows, the index is built once per data version
+    print()
+    print(f'{"days":>10} {"batched [ms]":>13} {"indexed [ms]":>13} {"index build [ms]":>17}')
+    for n_days in [180, 365, 730, 1460]:
+        app = load_app(n_countries=190, n_days=n_days)
+        state = app.data_store.current
+        countries = list(state.countries[:30])
+        range_slider_value = [len(state.dates) - 61, len(state.dates) - 1]
+        build, _ = best_of(lambda: RollingIndex(state.dfs['confirmed']['daily cases']['data']).moving_average(countries, range_slider_value, 7))
+        timings = [best_of(func, app, state.dfs, countries, range_slider_value, 7)[0] for func in [smooth_batched, smooth_indexed]]
+        print(f'{n_days:>10} ' + ' '.join(f'{seconds*1000:>{width}.2f}' for seconds, width in zip([*timings, build], [13, 13, 17])))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# Run from the covid_19 directory: python -m benchmarks.bench_serialization
+import json
+from plotly.utils import PlotlyJSONEncoder
+
+from benchmarks.common import load_app, best_of
+
+GRAPH_ARGUMENTS = dict(
+    yaxis_data_selection_value='confirmed',
+    xaxis_data_selection_value='time',
+    yaxis_data_evaluation_value='daily cases',
+    xaxis_data_evaluation_value='cases',
+    yaxis_type_value='log',
+    xaxis_type_value='lin',
+    yaxis_averaging_days=7,
+    xaxis_averaging_days=1,
+)
+
+def build_legacy_figure(app, countries, range_slider_value):
+    # Trace data as build_graph produced it before TraceSerializer: pandas objects plus the selection as text
+    dfs = app.data_store.current.dfs
+    data = []
+    for country in countries:
+        y = app.get_country_data_df(dfs, 'confirmed', 'daily cases', country, range_slider_value).rolling(7).mean()
+        x = app.get_country_data_df(dfs, 'time', 'cases', country, range_slider_value)
+        data.append(dict(x=x, y=y, text=countries, mode='line', opacity=.7, marker={'size':15, 'line':{'width':.5}}, name=country))
+    return {'data':data}
+
+def build_compact_figure(app, countries, range_slider_value):
+    graph = app.build_graph(countries, range_slider_value, dfs=app.data_store.current.dfs, **GRAPH_ARGUMENTS)
+    return {'data':graph.figure['data']}
+
+def encode(figure):
+    return json.dumps(figure, cls=PlotlyJSONEncoder)
+
+def main():
+    app = load_app(n_countries=60, n_days=365)
+    state = app.data_store.current
+    range_slider_value = [0, len(state.dates) - 1]
+    print(f'{"countries":>10} {"implementation":>15} {"build [ms]":>11} {"encode [ms]":>12} {"payload [KiB]":>14}')
+    for n_countries in [1, 10, 50]:
+        countries = list(state.countries[:n_countries])
+        for name, build in [('legacy', build_legacy_figure), ('compact', build_compact_figure)]:
+            build_seconds, figure = best_of(build, app, countries, range_slider_value)
+            encode_seconds, payload = best_of(encode, figure)
+            print(f'{n_countries:>10} {name:>15} {build_seconds*1000:>11.2f} {encode_seconds*1000:>12.2f} {len(payload)/1024:>14.1f}')
+
+if __name__ == '__main__':
+    main()
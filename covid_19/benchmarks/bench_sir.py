@@ -0,0 +1,33 @@
+# Run from the covid_19 directory: python -m benchmarks.bench_sir
+import numpy as np
+
+from benchmarks.common import best_of
+from pandemic_models.sir_model import SIR, solve_sir
+
+N0, I0, DAYS = 8.3e7, 100, 180
+
+def scenarios(n_scenarios):
+    rng = np.random.default_rng(0)
+    return rng.uniform(1e-9, 5e-9, n_scenarios), rng.uniform(.05, .2, n_scenarios)
+
+def run_loop(a, b):
+    return [SIR(N0, I0, a_value, b_value, DAYS) for a_value, b_value in zip(a, b)]
+
+def main():
+    a, b = scenarios(1)
+    reference = solve_sir(N0, I0, a, b, DAYS, steps=20000, method='rk4').I
+    for method, steps in [('euler', 10000), ('rk4', 200), ('rk4', 1000)]:
+        error = np.max(np.abs(solve_sir(N0, I0, a, b, DAYS, steps=steps, method=method).I - reference)) / N0
+        print(f'{method} with {steps} steps, max deviation from rk4 with 20000 steps: {error:.2e} of N0')
+    print(f'{"scenarios":>10} {"SIR loop [ms]":>14} {"euler batch [ms]":>17} {"rk4 1000 steps [ms]":>20}')
+    for n_scenarios in [1, 10, 100, 500]:
+        a, b = scenarios(n_scenarios)
+        timings = [
+            best_of(run_loop, a, b, repeat=1)[0],
+            best_of(solve_sir, N0, I0, a, b, DAYS, repeat=3)[0],
+            best_of(solve_sir, N0, I0, a, b, DAYS, steps=1000, method='rk4', repeat=3)[0],
+        ]
+        print(f'{n_scenarios:>10} ' + ' '.join(f'{seconds*1000:>{width}.1f}' for seconds, width in zip(timings, [14, 17, 20])))
+
+if __name__ == '__main__':
+    main()
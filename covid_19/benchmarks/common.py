@@ -0,0 +1,29 @@
+import os, sys, time, importlib
+
+from benchmarks.fixtures import write_jhu_fixture
+
+def load_app(fixture_dir:str=None, **fixture_kwargs):
+    # Imports app.py against a synthetic fixture, without snapshot, refresh, model fit or network access
+    fixture_dir = fixture_dir or write_jhu_fixture(**fixture_kwargs)
+    os.environ['COVID_APP_DATA_SOURCE'] = fixture_dir
+    os.environ['COVID_APP_SNAPSHOT_DIR'] = ''
+    os.environ['COVID_APP_DATA_REFRESH_INTERVAL'] = '0'
+    os.environ['COVID_APP_FIGURE_CACHE_DIR'] = ''
+    os.environ['COVID_APP_SIR_FIT_ENABLED'] = 'False'
+    os.environ['COVID_APP_DATA_LOAD_ON_IMPORT'] = 'True'
+    # Settings are read at import time, so reimport everything that captured them
+    for module in list(sys.modules):
+        if module.split('.')[0] in ('settings', 'data_api', 'figures', 'pandemic_models', 'app'):
+            sys.modules.pop(module)
+    app = importlib.import_module('app')
+    if not app.data_store.wait_ready(timeout=600):
+        raise RuntimeError(f'fixture data did not load: {app.data_store.last_error}')
+    return app
+
+def best_of(func, *args, repeat:int=5, **kwargs):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
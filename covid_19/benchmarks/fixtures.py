@@ -0,0 +1,63 @@
+import os, json, tempfile
+import numpy as np
+import pandas as pd
+
+from data_api.apis import LIST_OF_AVALIABLE_DATASETS, COUNTRY_NAME_ALIASES
+from data_api.regions import POPULATION_NAME_ALIASES
+
+# Share of confirmed cases ending up in each dataset of the synthetic fixture
+DATASET_FACTORS = {'confirmed':1.0, 'recovered':.6, 'deaths':.05}
+
+# Real JHU names first, so the initial selection of the app and the recorded callback sequences find their countries
+REAL_COUNTRY_NAMES = ['Germany', 'Italy', 'France', 'Spain', *COUNTRY_NAME_ALIASES, *POPULATION_NAME_ALIASES]
+
+def synthetic_country_names(n_countries:int):
+    names = REAL_COUNTRY_NAMES[:n_countries]
+    return names + [f'Country {idx}' for idx in range(n_countries - len(names))]
+
+def write_jhu_fixture(target_dir:str=None, n_countries:int=190, n_days:int=120, n_provinces:int=1, seed:int=0):
+    # Writes JHU-format time series csv files plus a restcountries-style population.json
+    target_dir = target_dir or tempfile.mkdtemp(prefix='covid_19_fixture_')
+    os.makedirs(target_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    countries = synthetic_country_names(n_countries)
+    dates = pd.date_range('2020-01-22', periods=n_days)
+    date_columns = [f'{date.month}/{date.day}/{date.strftime("%y")}' for date in dates]
+    daily = rng.poisson(50, size=(n_countries * n_provinces, n_days))
+    for dataset in LIST_OF_AVALIABLE_DATASETS:
+        df = pd.DataFrame((daily * DATASET_FACTORS[dataset]).cumsum(axis=1).astype('int64'), columns=date_columns)
+        df.insert(0, 'Long', rng.uniform(-180, 180, len(df)).round(4))
+        df.insert(0, 'Lat', rng.uniform(-90, 90, len(df)).round(4))
+        df.insert(0, 'Country/Region', np.repeat(countries, n_provinces))
+        # Like the JHU files, most countries come without a province
+        provinces = [f'Province {idx}' for idx in range(n_provinces)] * n_countries if n_provinces > 1 else [''] * (n_countries - 1) + ['Province 0']
+        df.insert(0, 'Province/State', provinces)
+        df.to_csv(os.path.join(target_dir, f'time_series_covid19_{dataset}_global.csv'), index=False)
+    population = [{'name':POPULATION_NAME_ALIASES.get(country, COUNTRY_NAME_ALIASES.get(country, country)), 'population':int(rng.integers(10**5, 10**9))} for country in countries]
+    with open(os.path.join(target_dir, 'population.json'), 'w') as population_file:
+        json.dump(population, population_file)
+    return target_dir
+
+def write_jhu_us_fixture(target_dir:str=None, n_states:int=50, n_counties:int=60, n_days:int=120, seed:int=0):
+    # County level files in the layout of time_series_covid19_{dataset}_US.csv
+    target_dir = target_dir or tempfile.mkdtemp(prefix='covid_19_us_fixture_')
+    os.makedirs(target_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2020-01-22', periods=n_days)
+    date_columns = [f'{date.month}/{date.day}/{date.strftime("%y")}' for date in dates]
+    n_rows = n_states * n_counties
+    states = np.repeat([f'State {idx}' for idx in range(n_states)], n_counties)
+    counties = [f'County {idx}' for idx in range(n_counties)] * n_states
+    daily = rng.poisson(5, size=(n_rows, n_days))
+    for dataset in ['confirmed', 'deaths']:
+        df = pd.DataFrame((daily * DATASET_FACTORS[dataset]).cumsum(axis=1).astype('int64'), columns=date_columns)
+        metadata = pd.DataFrame({
+            'UID':84000000 + np.arange(n_rows), 'iso2':'US', 'iso3':'USA', 'code3':840, 'FIPS':1000.0 + np.arange(n_rows),
+            'Admin2':counties, 'Province_State':states, 'Country_Region':'US',
+            'Lat':rng.uniform(20, 60, n_rows).round(4), 'Long_':rng.uniform(-160, -70, n_rows).round(4),
+            'Combined_Key':[f'{county}, {state}, US' for county, state in zip(counties, states)],
+        })
+        if dataset == 'deaths':
+            metadata['Population'] = rng.integers(10**3, 10**6, n_rows)
+        pd.concat([metadata, df], axis=1).to_csv(os.path.join(target_dir, f'time_series_covid19_{dataset}_US.csv'), index=False)
+    return target_dir
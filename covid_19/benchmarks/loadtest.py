@@ -0,0 +1,145 @@
+# Run from the covid_19 directory: python -m benchmarks.loadtest --workers 1 2 4
+# Replays the recorded callback sequences of callback_sequences.json against gunicorn serving app:server
+import os, sys, json, time, socket, argparse, tempfile, threading, subprocess
+import numpy as np
+import requests
+
+from benchmarks.fixtures import write_jhu_fixture
+
+SEQUENCES_PATH = os.path.join(os.path.dirname(__file__), 'callback_sequences.json')
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+def start_server(fixture_dir:str, n_workers:int, port:int, clientside:bool, figure_cache:bool):
+    # Workers share one snapshot, the refresh and the model fit are off so only callbacks load the server
+    env = dict(os.environ,
+        COVID_APP_DATA_SOURCE=fixture_dir,
+        COVID_APP_SNAPSHOT_DIR=tempfile.mkdtemp(prefix='covid_19_loadtest_snapshot_'),
+        COVID_APP_DATA_REFRESH_INTERVAL='0',
+        COVID_APP_SIR_FIT_ENABLED='False',
+        COVID_APP_CLIENTSIDE_GRAPH=str(clientside),
+        COVID_APP_WORKERS=str(n_workers),
+        COVID_APP_FIGURE_CACHE_SIZE=os.environ.get('COVID_APP_FIGURE_CACHE_SIZE', '256') if figure_cache else '0',
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:server'],
+        cwd=APP_DIR, env=env,
+    )
+    url = f'http://127.0.0.1:{port}'
+    ready_responses = 0
+    for _ in range(6000):
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with {server.returncode}')
+        try:
+            # Workers load in the background, wait until several requests in a row hit ready workers
+            ready_responses = ready_responses + 1 if requests.get(f'{url}/readyz', timeout=1).ok else 0
+            if ready_responses >= 4 * n_workers:
+                return server, url
+        except requests.ConnectionError:
+            ready_responses = 0
+        time.sleep(.1)
+    server.terminate()
+    raise RuntimeError('gunicorn did not come up')
+
+def load_requests(url:str, sequences:dict):
+    # Expands the recorded sessions into _dash-update-component bodies, using the callbacks the server registered
+    dependencies = requests.get(f'{url}/_dash-dependencies').json()
+    callbacks = dict()
+    for dependency in dependencies:
+        if dependency.get('clientside_function'):
+            continue
+        first_output = dependency['output'].strip('.').split('...')[0]
+        callbacks[first_output] = dependency
+    sessions = dict()
+    for name, steps in sequences['sessions'].items():
+        values = dict(sequences['initial'])
+        bodies = []
+        for step in steps:
+            values.update(step.get('set', {}))
+            for output in step['fire']:
+                if output not in callbacks:
+                    # Handled in the browser in this graph mode
+                    continue
+                dependency = callbacks[output]
+                component = lambda item: {'id':item['id'], 'property':item['property'], 'value':values[f"{item['id']}.{item['property']}"]}
+                bodies.append({
+                    'output':dependency['output'],
+                    'inputs':[component(item) for item in dependency['inputs']],
+                    'state':[component(item) for item in dependency['state']],
+                    'changedPropIds':[f"{item['id']}.{item['property']}" for item in dependency['inputs']],
+                })
+        sessions[name] = bodies
+    return sessions
+
+def warm_up(url:str, sessions:dict):
+    session = requests.Session()
+    for bodies in sessions.values():
+        for body in bodies:
+            session.post(f'{url}/_dash-update-component', json=body, timeout=30)
+
+def run_load(url:str, sessions:dict, concurrency:int, duration:float):
+    # Every client thread replays the sessions round robin with its own keep-alive connection
+    latencies, errors, lock = [], [0], threading.Lock()
+    deadline = time.perf_counter() + duration
+    bodies = [body for session in sessions.values() for body in session]
+    if not bodies:
+        raise ValueError('none of the recorded callbacks is registered on the server')
+
+    def client(offset:int):
+        session = requests.Session()
+        idx = offset
+        while time.perf_counter() < deadline:
+            body = bodies[idx % len(bodies)]
+            idx += 1
+            start = time.perf_counter()
+            try:
+                ok = session.post(f'{url}/_dash-update-component', json=body, timeout=30).status_code in (200, 204)
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += not ok
+
+    threads = [threading.Thread(target=client, args=(idx * 7,)) for idx in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(latencies), errors[0], time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays recorded dashboard callbacks against gunicorn and reports latency and throughput')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--countries', type=int, default=190)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--graph', choices=['server', 'clientside'], default='server')
+    parser.add_argument('--no-figure-cache', action='store_true', help='build every figure, like the first view of each new selection')
+    arguments = parser.parse_args()
+
+    with open(SEQUENCES_PATH) as sequences_file:
+        sequences = json.load(sequences_file)
+    fixture_dir = write_jhu_fixture(n_countries=arguments.countries, n_days=arguments.days)
+    print(f'{arguments.graph} graph{" without figure cache" if arguments.no_figure_cache else ""}, {arguments.countries} countries x {arguments.days} days, {arguments.concurrency} clients for {arguments.duration:.0f}s')
+    print(f'{"workers":>8} {"requests":>9} {"errors":>7} {"p50 [ms]":>9} {"p99 [ms]":>9} {"req/s":>8}')
+    for n_workers in arguments.workers:
+        server, url = start_server(fixture_dir, n_workers, free_port(), arguments.graph == 'clientside', not arguments.no_figure_cache)
+        try:
+            sessions = load_requests(url, sequences)
+            warm_up(url, sessions)
+            latencies, errors, elapsed = run_load(url, sessions, arguments.concurrency, arguments.duration)
+        finally:
+            server.terminate()
+            server.wait()
+        p50, p99 = np.percentile(latencies * 1000, [50, 99]) if len(latencies) else (np.nan, np.nan)
+        print(f'{n_workers:>8} {len(latencies):>9} {errors:>7} {p50:>9.1f} {p99:>9.1f} {len(latencies)/elapsed:>8.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -1,84 +1,79 @@
-import requests, copy
+import json
 import pandas as pd
 # from collections import OrderedDict as dict
 
+from settings import JHU_TIME_SERIES_URL, JHU_US_TIME_SERIES_URL, POPULATION_URL, DATA_SOURCE, DATA_CACHE_DIR, POPULATION_MAX_AGE, REGION_LEVEL
+from data_api.fetch import fetch_source, fetch_sources, resolve_source
+from data_api.evaluations import DatasetTree, EVALUATIONS
+from data_api.ingest import aggregate_time_series
+from data_api.regions import REGION_LEVELS, aggregate_regions, align_regions, add_world
+from monitoring.metrics import DATA_LOAD_SECONDS
+
 LIST_OF_AVALIABLE_DATASETS = ['confirmed','recovered', 'deaths']
+# Datasets with county level files for the US
+LIST_OF_US_DATASETS = ['confirmed', 'deaths']
+US_COUNTRY_NAME = 'US'
 
-def get_population_by_country_dict():
-    return {c['name'].lower():c['population'] for c in requests.get('https://restcountries.eu/rest/v2/all').json()}
+# Johns Hopkins country names renamed in the region columns, INITIAL_COUNTRIES refers to the US by this name
+COUNTRY_NAME_ALIASES = {
+    US_COUNTRY_NAME:'United States of America',
+}
 
-def generate_dataframes_dict(source_file_list = [(sub,f"https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_{sub}_global.csv") for sub in LIST_OF_AVALIABLE_DATASETS]):
-    dfs = dict()
-    country_population_dict = get_population_by_country_dict()
-    for sub, path in source_file_list:
-        # TODO: Parallelize this
-        sub_cap = sub.lower()
-        df = pd.read_csv(path)
-        df = df.groupby('Country/Region').agg('sum').drop(['Lat','Long'],axis=1).T
-        df.rename(columns={'US':'United States of America'}, inplace=True)
-        df['World'] = df.sum(axis=1)
-        df.index = pd.to_datetime(df.index, infer_datetime_format=True)
+def get_source_file_list(data_source:str=DATA_SOURCE):
+    return [(sub, resolve_source(data_source, f'time_series_covid19_{sub}_global.csv', JHU_TIME_SERIES_URL.format(dataset=sub))) for sub in LIST_OF_AVALIABLE_DATASETS]
+
+def get_us_source_file_list(data_source:str=DATA_SOURCE):
+    return [(f'{sub}_us', resolve_source(data_source, f'time_series_covid19_{sub}_US.csv', JHU_US_TIME_SERIES_URL.format(dataset=sub))) for sub in LIST_OF_US_DATASETS]
+
+def get_population_source(data_source:str=DATA_SOURCE):
+    return resolve_source(data_source, 'population.json', POPULATION_URL)
 
-        # Normalizing by country population
-        available_country_population = set(country_population_dict.keys())
-        df_normalized = pd.DataFrame()
-        for country in df.columns:
-            c = country.lower()
-            if c in available_country_population:
-                country_population = country_population_dict.get(c)
-                df_normalized[country] = df[country] / (country_population/100)
-            else:
-                df_normalized[country] = pd.Series([0 for _ in df.index])
-        
-        cases = {
-            'data':df.copy(deep=True),
-            'unit':'# cases',
-            'tool_tip':'# of cases as gathered in Johns Hopkins data-repository',
-        }
-        cases_growth_rate = {
-            'data':df.pct_change().copy(deep=True)*100,
-            'unit':'% change from previous day',
-            'tool_tip':'calculated % change from # of cases as gathered in Johns Hopkins data-repository',
-        }
-        new_cases = {
-            'data':df.diff().copy(deep=True),
-            'unit':'# cases / day',
-            'tool_tip':'calculated difference of cases (as gathered in Johns Hopkins data-repository) between two consecutive days',
-        }
-        new_cases_normalized = {
-            'data':df_normalized.diff().copy(deep=True),
-            'unit':'% of countrys population / day',
-            'tool_tip':'calculated difference of cases (as gathered in Johns Hopkins data-repository) between two consecutive days',
-        }
-        normalized_cases = {
-            'data': df_normalized.copy(deep=True),
-            'unit':'% of countrys population',
-            'tool_tip':'calculated from # of cases as gathered in Johns Hopkins data-repository divided by countrys population countn as collected from https://restcountries.eu',
-        }
-        dfs[sub_cap] = {
-            'cases':cases,
-            'cases normalized':normalized_cases,
-            'daily cases':new_cases,
-            'daily cases normalized':new_cases_normalized,
-            'growth rate':cases_growth_rate,
-        }
-        evaluation_options = dfs[sub_cap].keys()
-    
-    # Calculate the current infected count
-    name_infected = 'infected'
-    dfs[name_infected] = dict()
-    
-    for key in evaluation_options:
-        dfs[name_infected][key] = copy.deepcopy(dfs['confirmed'][key])
-        dfs[name_infected][key]['data'] = dfs['confirmed'][key]['data'] - dfs['deaths'][key]['data'] - dfs['recovered'][key]['data']
+def parse_population(content:bytes):
+    return {c['name'].lower():c['population'] for c in json.loads(content)}
 
-    dfs['time'] = {key:{
-        'data':pd.DataFrame({country:df.index for country in df.columns}),
-        'unit':'date',
-    } for key in evaluation_options}
+def get_population_by_country_dict(source:str=None):
+    # Served from the fetch cache while fresh, so repeated calls don't hit the network
+    result = fetch_source(source or get_population_source(), cache_dir=DATA_CACHE_DIR, max_age=POPULATION_MAX_AGE)
+    return parse_population(result.content)
+
+def build_region_frame(content:bytes, us_content:bytes=None, region_level:str=REGION_LEVEL):
+    # Countries, World and (depending on region_level) provinces and US states/counties of one dataset,
+    # every level aggregated once here so no query has to regroup or sum
+    if region_level == 'country':
+        df, parents = aggregate_regions(aggregate_time_series(content), COUNTRY_NAME_ALIASES)
+    else:
+        df, parents = aggregate_regions(aggregate_time_series(content, ('Country/Region','Province/State')), COUNTRY_NAME_ALIASES)
+    if us_content is not None:
+        # The US total stays the one of the global file, the county files only add the levels below it
+        us_df, us_parents = aggregate_regions(aggregate_time_series(us_content, ('Country/Region','Province/State','Admin2')), COUNTRY_NAME_ALIASES, min_depth=2)
+        us_df = us_df.drop(columns=[region for region in us_df.columns if region in df.columns])
+        df = pd.concat([df, us_df], axis=1)
+        parents.update(us_parents)
+    return add_world(df, parents), parents
+
+def generate_dataframes_dict(source_file_list=None, population_source:str=None, region_level:str=REGION_LEVEL):
+    if region_level not in REGION_LEVELS:
+        raise ValueError(f'unknown region level {region_level}, use one of {REGION_LEVELS}')
+    source_file_list = source_file_list or get_source_file_list()
+    sources = dict(source_file_list)
+    if region_level == 'county':
+        sources.update(get_us_source_file_list())
+    sources['population'] = population_source or get_population_source()
+    with DATA_LOAD_SECONDS.time(stage='download'):
+        fetched = fetch_sources(sources, cache_dir=DATA_CACHE_DIR, max_age={'population':POPULATION_MAX_AGE})
+    base_frames = dict()
+    parents = dict()
+    country_population_dict = parse_population(fetched['population'].content)
+    for sub, path in source_file_list:
+        us_result = fetched.get(f'{sub}_us')
+        # Streams the csv summed per region, the date index comes straight from the header
+        df, dataset_parents = build_region_frame(fetched[sub].content, us_result and us_result.content, region_level)
+        base_frames[sub.lower()] = df
+        parents.update(dataset_parents)
+    base_frames = align_regions(base_frames)
 
-    # Sort dfs by key
-    # dfs = {key: value for key, value in sorted(dfs.items(),key=lambda i: i[0])}
-    dfs = {key: dfs[key] for key in ['confirmed',name_infected,'recovered','deaths','time']}
+    # Evaluations and the infected count are calculated lazily by the tree, timed as the 'normalize' and 'derive' stages
+    with DATA_LOAD_SECONDS.time(stage='tree'):
+        dfs = DatasetTree(base_frames, country_population_dict, region_parents=parents)
 
-    return (df.columns.unique(), evaluation_options, df.index, dfs)
\ No newline at end of file
+    return (dfs.countries, list(EVALUATIONS), dfs.dates, dfs)
\ No newline at end of file
@@ -0,0 +1,279 @@
+import threading, hashlib
+from collections import namedtuple, OrderedDict
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+
+from settings import EVALUATION_CACHE_SIZE, DATA_STORAGE, SIR_FIT_ENABLED
+from monitoring.metrics import DATA_LOAD_SECONDS
+from data_api.regions import RegionHierarchy, population_key
+
+# func(tree, selection) returns the evaluated frame, other evaluations are requested through tree.get_data
+# lookback is the number of preceding days a row depends on, used to extend cached frames incrementally
+Evaluation = namedtuple('Evaluation', ['func', 'unit', 'tool_tip', 'lookback'])
+
+def normalize_by_population(df:pd.DataFrame, country_population_dict:dict):
+    # Cases in % of the countrys population, countries without a known population (e.g. World) become NaN
+    with DATA_LOAD_SECONDS.time(stage='normalize'):
+        population = pd.Series(country_population_dict, dtype='float64').reindex(df.columns.map(population_key))
+        return df / (population.to_numpy() / 100)
+
+EVALUATIONS = OrderedDict([
+    ('cases', Evaluation(
+        lambda tree, selection: tree.get_base(selection),
+        '# cases',
+        '# of cases as gathered in Johns Hopkins data-repository',
+        0,
+    )),
+    ('cases normalized', Evaluation(
+        lambda tree, selection: normalize_by_population(tree.get_base(selection), tree.country_population_dict),
+        '% of countrys population',
+        'calculated from # of cases as gathered in Johns Hopkins data-repository divided by countrys population countn as collected from https://restcountries.eu',
+        0,
+    )),
+    ('daily cases', Evaluation(
+        lambda tree, selection: tree.get_base(selection).diff(),
+        '# cases / day',
+        'calculated difference of cases (as gathered in Johns Hopkins data-repository) between two consecutive days',
+        1,
+    )),
+    ('daily cases normalized', Evaluation(
+        lambda tree, selection: tree.get_data(selection, 'cases normalized').diff(),
+        '% of countrys population / day',
+        'calculated difference of cases (as gathered in Johns Hopkins data-repository) between two consecutive days',
+        1,
+    )),
+    ('growth rate', Evaluation(
+        lambda tree, selection: tree.get_base(selection).pct_change(fill_method=None) * 100,
+        '% change from previous day',
+        'calculated % change from # of cases as gathered in Johns Hopkins data-repository',
+        1,
+    )),
+])
+
+# Datasets calculated from the downloaded ones, func(tree) returns the cumulative cases
+DERIVED_DATASETS = OrderedDict([
+    ('infected', lambda tree: tree.get_base('confirmed') - tree.get_base('deaths') - tree.get_base('recovered')),
+])
+
+MAX_LOOKBACK = max(evaluation.lookback for evaluation in EVALUATIONS.values())
+
+# Datasets produced by a model fitted in the background, NaN until the fit is published with set_model_frames
+MODEL_DATASETS = ['SIR infected']
+
+TIME_SELECTION = 'time'
+DATASET_ORDER = ['confirmed', 'infected', 'SIR infected', 'recovered', 'deaths', TIME_SELECTION]
+
+STORAGE_MODES = ['frames', 'compact']
+
+def fits_int32(values:np.ndarray):
+    info = np.iinfo('int32')
+    return np.isfinite(values).all() and (values == np.round(values)).all() and values.min(initial=0) >= info.min and values.max(initial=0) <= info.max
+
+def frame_view(cube:np.ndarray, layer:int, dates:pd.DatetimeIndex, countries:pd.Index):
+    # Zero-copy DataFrame onto one dataset of the cube, all views share the date and country index objects
+    return pd.DataFrame(cube[layer], index=dates, columns=countries, copy=False)
+
+def compact_base_frames(base_frames:dict):
+    # Packs the cumulative frames into one contiguous (dataset x date x country) array, returns it with views onto it
+    first = next(iter(base_frames.values()))
+    dates, countries = first.index, first.columns
+    # int32 if every count is a finite integer in range, float32 otherwise. Filled layer by layer, no float64 stack
+    values = [df.reindex(columns=countries).to_numpy(dtype='float64') for df in base_frames.values()]
+    cube = np.empty((len(values), len(dates), len(countries)), dtype='int32' if all(fits_int32(layer) for layer in values) else 'float32')
+    for layer, layer_values in enumerate(values):
+        cube[layer] = layer_values
+    return cube, {selection: frame_view(cube, layer, dates, countries) for layer, selection in enumerate(base_frames)}
+
+class TimeAxis:
+    # Virtual 'time' data, every country maps to the date index itself
+    def __init__(self, dates:pd.DatetimeIndex):
+        self.dates = dates
+
+    def __getitem__(self, country):
+        return pd.Series(self.dates, name=country)
+
+class LazyEntry(Mapping):
+    # Behaves like the former {'data':..., 'unit':..., 'tool_tip':...} dict, 'data' is evaluated on access
+    def __init__(self, tree, selection:str, evaluation:str):
+        self.tree, self.selection, self.evaluation = tree, selection, evaluation
+
+    def _meta(self):
+        if self.selection == TIME_SELECTION:
+            return {'unit':'date'}
+        evaluation = EVALUATIONS[self.evaluation]
+        return {'unit':evaluation.unit, 'tool_tip':evaluation.tool_tip}
+
+    def __getitem__(self, key):
+        if key == 'data':
+            return self.tree.get_data(self.selection, self.evaluation)
+        return self._meta()[key]
+
+    def __iter__(self):
+        return iter(['data', *self._meta()])
+
+    def __len__(self):
+        return 1 + len(self._meta())
+
+class SelectionView(Mapping):
+    def __init__(self, tree, selection:str):
+        self.tree, self.selection = tree, selection
+
+    def __getitem__(self, evaluation):
+        if evaluation not in EVALUATIONS:
+            raise KeyError(evaluation)
+        return LazyEntry(self.tree, self.selection, evaluation)
+
+    def __iter__(self):
+        return iter(EVALUATIONS)
+
+    def __len__(self):
+        return len(EVALUATIONS)
+
+class DatasetTree(Mapping):
+    # dfs[selection][evaluation]['data'] computed on first access and kept in a bounded LRU cache,
+    # only the downloaded cumulative frames stay resident. Frames published by a loader process
+    # ({(selection, evaluation): frame}, usually read-only memory maps) are used instead of computing.
+    # With the 'compact' storage the cumulative counts are views onto one int32/float32 cube and
+    # evaluations are kept as float32, cube passes an already packed (e.g. memory mapped) cube.
+    # Columns are regions, region_parents ({region: parent}) links provinces and counties to their country.
+    # model_datasets are only offered while a model is fitted for them
+    def __init__(self, base_frames:dict, country_population_dict:dict, cache_size:int=EVALUATION_CACHE_SIZE, data_version:str=None, published_frames:dict=None, storage:str=DATA_STORAGE, cube:np.ndarray=None, region_parents:dict=None, model_datasets:list=MODEL_DATASETS if SIR_FIT_ENABLED else ()):
+        if storage not in STORAGE_MODES:
+            raise ValueError(f'unknown storage {storage}, use one of {STORAGE_MODES}')
+        if storage == 'compact' and cube is None:
+            cube, base_frames = compact_base_frames(base_frames)
+        self.storage = storage
+        self.cube = cube
+        self.evaluation_dtype = 'float32' if storage == 'compact' else 'float64'
+        self.base_frames = base_frames
+        self.published_frames = published_frames or dict()
+        self.country_population_dict = country_population_dict
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._data_version = data_version
+        first = next(iter(base_frames.values()))
+        self.dates = first.index
+        self.countries = first.columns
+        self.time_axis = TimeAxis(self.dates)
+        self.regions = RegionHierarchy(region_parents)
+        self.model_frames = dict()
+        self._empty_model_frame = None
+        self._derived = dict()
+        self.selections = [selection for selection in DATASET_ORDER if selection in base_frames or selection in DERIVED_DATASETS or selection in model_datasets or selection == TIME_SELECTION]
+
+    def __getitem__(self, selection):
+        if selection not in self.selections:
+            raise KeyError(selection)
+        return SelectionView(self, selection)
+
+    def __iter__(self):
+        return iter(self.selections)
+
+    def __len__(self):
+        return len(self.selections)
+
+    @property
+    def data_version(self):
+        # Fingerprint of the cumulative counts, identical data gives an identical version
+        if self._data_version is None:
+            digest = hashlib.sha1(np.asarray(self.dates, dtype='datetime64[ns]').tobytes())
+            for selection, df in self.base_frames.items():
+                digest.update(selection.encode('utf-8'))
+                digest.update(np.ascontiguousarray(df.to_numpy(dtype='float64')).tobytes())
+            self._data_version = digest.hexdigest()[:16]
+        return self._data_version
+
+    def is_extended_by(self, other):
+        # True if other only appends days to this tree, history and countries unchanged
+        n_days = len(self.dates)
+        if len(other.dates) <= n_days or not other.countries.equals(self.countries) or not other.dates[:n_days].equals(self.dates):
+            return False
+        if set(other.base_frames) != set(self.base_frames) or other.country_population_dict != self.country_population_dict or other.regions.parents != self.regions.parents:
+            return False
+        return all(np.array_equal(df.to_numpy(), other.base_frames[selection].to_numpy()[:n_days], equal_nan=True) for selection, df in self.base_frames.items())
+
+    def extend_cache_from(self, previous):
+        # Carries the published and cached frames of previous over and computes only the appended rows,
+        # frames this tree has published itself are left alone
+        n_days = len(previous.dates)
+        offset = min(MAX_LOOKBACK, n_days)
+        tail_tree = DatasetTree({selection: df.iloc[n_days - offset:] for selection, df in self.base_frames.items()}, self.country_population_dict, cache_size=len(EVALUATIONS) * len(self.selections), storage=self.storage, region_parents=self.regions.parents)
+        with previous._lock:
+            cached = [*previous.published_frames.items(), *previous._cache.items()]
+        for (selection, evaluation), data in cached:
+            if selection in MODEL_DATASETS or (selection, evaluation) in self.published_frames:
+                continue
+            tail = tail_tree.get_base(selection) if evaluation == 'cases' else tail_tree.get_data(selection, evaluation)
+            with self._lock:
+                self._cache[(selection, evaluation)] = pd.concat([data, tail.iloc[offset:]])
+        return self
+
+    def _cached(self, key, compute):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        value = compute()
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return value
+
+    def set_model_frames(self, frames:dict):
+        # Publishes fitted model frames, evaluations cached from the previous (empty) frames are dropped
+        with self._lock:
+            self.model_frames.update(frames)
+            for key in [key for key in self._cache if key[0] in frames]:
+                del self._cache[key]
+
+    def empty_model_frame(self):
+        # One all NaN frame per tree stands in for every model dataset until its fit is published, so caches
+        # keyed on the frame (e.g. the rolling indexes) see the same object on every call
+        if self._empty_model_frame is None:
+            self._empty_model_frame = pd.DataFrame(np.full((len(self.dates), len(self.countries)), np.nan, dtype=self.evaluation_dtype), index=self.dates, columns=self.countries, copy=False)
+        return self._empty_model_frame
+
+    def get_base(self, selection:str):
+        if selection in self.base_frames:
+            return self.base_frames[selection]
+        if selection in MODEL_DATASETS:
+            return self.model_frames[selection] if selection in self.model_frames else self.empty_model_frame()
+        if (selection, 'cases') in self.published_frames:
+            return self.published_frames[(selection, 'cases')]
+        if self.storage == 'compact':
+            # Derived from the cube once per tree and kept outside the LRU, a new frame on every access would
+            # defeat caches keyed on the frame like the rolling indexes
+            return self.derived_frame(selection)
+        return self._cached((selection, 'cases'), lambda: self._derive(selection))
+
+    def derived_frame(self, selection:str):
+        with self._lock:
+            frame = self._derived.get(selection)
+        if frame is None:
+            frame = self._derive(selection)
+            with self._lock:
+                frame = self._derived.setdefault(selection, frame)
+        return frame
+
+    def _derive(self, selection:str):
+        with DATA_LOAD_SECONDS.time(stage='derive'):
+            return DERIVED_DATASETS[selection](self)
+
+    def _evaluate(self, selection:str, evaluation:str):
+        df = EVALUATIONS[evaluation].func(self, selection)
+        if self.storage == 'compact':
+            return df.astype(self.evaluation_dtype, copy=False)
+        return df
+
+    def get_data(self, selection:str, evaluation:str):
+        if selection == TIME_SELECTION:
+            return self.time_axis
+        if evaluation == 'cases':
+            return self.get_base(selection)
+        if (selection, evaluation) in self.published_frames:
+            return self.published_frames[(selection, evaluation)]
+        return self._cached((selection, evaluation), lambda: self._evaluate(selection, evaluation))
@@ -0,0 +1,160 @@
+import io, hashlib, tempfile
+import numpy as np
+import pandas as pd
+
+from settings import EXPORT_CHUNK_ROWS
+from data_api.query import choice_argument, regions_argument, date_argument, error_response
+
+# format: (mimetype, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+# Bytes read at once when streaming a finished file
+STREAM_BLOCK_SIZE = 256 * 1024
+# Worksheet limits of Excel, bigger slices have to be exported as csv or parquet
+XLSX_MAX_ROWS = 1048576
+XLSX_MAX_COLUMNS = 16384
+
+def parse_export_arguments(args, dfs):
+    # Validated slice of the tree from the query string, ValueError otherwise. Without region arguments all
+    # regions are exported, start and end are inclusive ISO dates
+    selection = choice_argument(args, 'selection', 'confirmed', [selection for selection in dfs.selections if selection != 'time'])
+    arguments = dict(
+        format=choice_argument(args, 'format', 'csv', list(EXPORT_FORMATS)),
+        selection=selection,
+        evaluation=choice_argument(args, 'evaluation', 'cases', list(dfs[selection])),
+        regions=regions_argument(args, dfs),
+        start=date_argument(args, 'start', dfs.dates, 0),
+        end=date_argument(args, 'end', dfs.dates, len(dfs.dates) - 1) + 1,
+    )
+    if arguments['start'] >= arguments['end']:
+        raise ValueError('start must not be after end')
+    if arguments['format'] == 'xlsx' and len(arguments['regions'] or dfs.countries) + 1 > XLSX_MAX_COLUMNS:
+        raise ValueError(f'xlsx exports are limited to {XLSX_MAX_COLUMNS - 1} regions')
+    if arguments['format'] == 'xlsx' and arguments['end'] - arguments['start'] + 1 > XLSX_MAX_ROWS:
+        raise ValueError(f'xlsx exports are limited to {XLSX_MAX_ROWS - 1} days')
+    return arguments
+
+def export_etag(data_version:str, arguments:dict):
+    # The content only depends on the data version and the slice, so the tag is known before anything is built
+    digest = hashlib.sha1(repr((data_version, tuple(sorted(arguments.items())))).encode('utf-8')).hexdigest()[:16]
+    return f'{data_version}-{digest}'
+
+def export_filename(arguments:dict):
+    name = f"covid-19_{arguments['selection']}_{arguments['evaluation']}".replace(' ', '-')
+    return f"{name}.{EXPORT_FORMATS[arguments['format']][1]}"
+
+def select_export_frame(dfs, selection:str, evaluation:str, regions:tuple, start:int, end:int, **kwargs):
+    # dates x regions slice, a view onto the (possibly memory mapped) frame of the tree where pandas allows it
+    data = dfs[selection][evaluation]['data']
+    if regions:
+        data = data.iloc[:, data.columns.get_indexer(list(regions))]
+    return data.iloc[start:end]
+
+def iter_csv(frame:pd.DataFrame, chunk_rows:int=EXPORT_CHUNK_ROWS):
+    # The header and then chunk_rows dates at a time, only one chunk is ever formatted in memory. The header is
+    # written by to_csv as well so region names are quoted the same way as in the rows
+    yield frame.iloc[:0].to_csv(index_label='date').encode('utf-8')
+    for start in range(0, len(frame), chunk_rows):
+        yield frame.iloc[start:start + chunk_rows].to_csv(header=False, date_format='%Y-%m-%d').encode('utf-8')
+
+def iter_file(file, block_size:int=STREAM_BLOCK_SIZE):
+    try:
+        file.seek(0)
+        for block in iter(lambda: file.read(block_size), b''):
+            yield block
+    finally:
+        file.close()
+
+class _ChunkSink(io.RawIOBase):
+    # Write only file object collecting what the parquet writer produced since the last drain
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data, self._chunks = b''.join(self._chunks), []
+        return data
+
+def iter_parquet(frame:pd.DataFrame, chunk_rows:int=EXPORT_CHUNK_ROWS):
+    # One row group per chunk, each is yielded as soon as the writer flushed it. pyarrow is optional
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    sink = _ChunkSink()
+    writer = None
+    for start in range(0, len(frame), chunk_rows):
+        table = pa.Table.from_pandas(frame.iloc[start:start + chunk_rows].rename_axis('date').reset_index(), preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema, compression='snappy')
+        writer.write_table(table)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def iter_xlsx(frame:pd.DataFrame):
+    # XLSX is a zip archive that is only complete once the workbook is closed. With constant_memory XlsxWriter
+    # flushes every finished row to its temporary files, the archive goes to a temporary file that is streamed
+    import xlsxwriter
+    output = tempfile.TemporaryFile()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    worksheet = workbook.add_worksheet('data')
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+    worksheet.write_row(0, 0, ['date', *frame.columns])
+    worksheet.set_column(0, 0, 12)
+    values = frame.to_numpy(dtype='float64')
+    for row, (date, row_values) in enumerate(zip(frame.index.to_pydatetime(), values), 1):
+        worksheet.write_datetime(row, 0, date, date_format)
+        for column in np.flatnonzero(np.isfinite(row_values)):
+            worksheet.write_number(row, column + 1, row_values[column])
+    workbook.close()
+    yield from iter_file(output)
+
+def iter_export(frame:pd.DataFrame, export_format:str):
+    if export_format == 'parquet':
+        return iter_parquet(frame)
+    if export_format == 'xlsx':
+        return iter_xlsx(frame)
+    return iter_csv(frame)
+
+def register_export_api(server, data_store, route:str='/api/export'):
+    # Streams a slice of the tree as csv, parquet or xlsx. The ETag is derived from the data version and the
+    # arguments, so a revalidating client gets a 304 without anything being built
+    from flask import request, Response, stream_with_context
+
+    @server.route(route)
+    def export_api():
+        state = data_store.current
+        if state is None:
+            return error_response('data is still loading', 503, retry_after=5)
+        try:
+            arguments = parse_export_arguments(request.args, state.dfs)
+        except ValueError as error:
+            return error_response(str(error))
+        if arguments['format'] == 'parquet':
+            try:
+                import pyarrow, pyarrow.parquet
+            except ImportError:
+                return error_response('parquet export needs pyarrow installed on the server', 501)
+        etag = export_etag(state.version, arguments)
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': 'no-cache',
+            'Content-Disposition': f'attachment; filename="{export_filename(arguments)}"',
+        }
+        if etag in request.if_none_match:
+            return Response(status=304, headers=headers)
+        frame = select_export_frame(state.dfs, **arguments)
+        return Response(stream_with_context(iter_export(frame, arguments['format'])), mimetype=EXPORT_FORMATS[arguments['format']][0], headers=headers)
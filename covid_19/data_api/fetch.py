@@ -0,0 +1,134 @@
+import os, json, time, hashlib, threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from settings import FETCH_MAX_WORKERS, FETCH_TIMEOUT
+
+FetchResult = namedtuple('FetchResult', ['source', 'content', 'etag', 'last_modified', 'fetched_at', 'from_cache'])
+
+_session = None
+_session_lock = threading.Lock()
+_memory_cache = dict()
+_memory_cache_lock = threading.Lock()
+
+def get_session():
+    # One pooled session per process, shared by all download threads
+    global _session
+    with _session_lock:
+        if _session is None:
+            adapter = HTTPAdapter(pool_connections=FETCH_MAX_WORKERS, pool_maxsize=FETCH_MAX_WORKERS, max_retries=2)
+            _session = requests.Session()
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+def is_local_source(source:str):
+    return urlparse(source).scheme in ('', 'file') or os.path.exists(source)
+
+def local_path(source:str):
+    parsed = urlparse(source)
+    if parsed.scheme == 'file':
+        return url2pathname(parsed.path)
+    return source
+
+def resolve_source(data_source:str, file_name:str, default_url:str):
+    # A configured local directory or file:// base replaces the upstream url
+    if not data_source:
+        return default_url
+    if urlparse(data_source).scheme in ('', 'file'):
+        return os.path.join(local_path(data_source), file_name)
+    return data_source.rstrip('/') + '/' + file_name
+
+def _cache_paths(cache_dir:str, source:str):
+    key = hashlib.sha1(source.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f'{key}.json'), os.path.join(cache_dir, f'{key}.body')
+
+def _load_cached(source:str, cache_dir:str=None):
+    # Validators of the cached copy without its content, None unless a body is stored in cache_dir
+    if not cache_dir:
+        return None
+    with _memory_cache_lock:
+        cached = _memory_cache.get(source)
+    if cached is not None:
+        return cached
+    meta_path, body_path = _cache_paths(cache_dir, source)
+    try:
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(body_path):
+        return None
+    return FetchResult(source, None, meta.get('etag'), meta.get('last_modified'), meta.get('fetched_at', 0), True)
+
+def _read_cached_body(source:str, cache_dir:str):
+    try:
+        with open(_cache_paths(cache_dir, source)[1], 'rb') as body_file:
+            return body_file.read()
+    except OSError:
+        return None
+
+def _store_cached(result:FetchResult, cache_dir:str=None, write_body:bool=True):
+    # Only the validators stay in memory, the body is read back from cache_dir when the source is unchanged
+    if not cache_dir:
+        return
+    with _memory_cache_lock:
+        _memory_cache[result.source] = result._replace(content=None)
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path, body_path = _cache_paths(cache_dir, result.source)
+    files = [(meta_path, 'w', json.dumps({'source':result.source, 'etag':result.etag, 'last_modified':result.last_modified, 'fetched_at':result.fetched_at}))]
+    if write_body:
+        files.insert(0, (body_path, 'wb', result.content))
+    # Write to temporary files first so concurrent workers never read half written files
+    for path, mode, payload in files:
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, mode) as tmp_file:
+            tmp_file.write(payload)
+        os.replace(tmp_path, path)
+
+def _fetch_local(source:str):
+    path = local_path(source)
+    with open(path, 'rb') as local_file:
+        content = local_file.read()
+    return FetchResult(source, content, None, formatdate(os.path.getmtime(path), usegmt=True), time.time(), False)
+
+def fetch_source(source:str, cache_dir:str=None, max_age:float=0, timeout:float=FETCH_TIMEOUT):
+    if is_local_source(source):
+        return _fetch_local(source)
+    cached = _load_cached(source, cache_dir)
+    if cached is not None and time.time() - cached.fetched_at < max_age:
+        content = _read_cached_body(source, cache_dir)
+        if content is not None:
+            return cached._replace(content=content, from_cache=True)
+    headers = dict()
+    if cached is not None:
+        if cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+    response = get_session().get(source, headers=headers, timeout=timeout)
+    content = _read_cached_body(source, cache_dir) if response.status_code == 304 and cached is not None else None
+    if content is not None:
+        result = cached._replace(content=content, fetched_at=time.time(), from_cache=True)
+        _store_cached(result, cache_dir, write_body=False)
+        return result
+    if response.status_code == 304:
+        # The cached body vanished since its validators were read
+        response = get_session().get(source, timeout=timeout)
+    response.raise_for_status()
+    result = FetchResult(source, response.content, response.headers.get('ETag'), response.headers.get('Last-Modified'), time.time(), False)
+    _store_cached(result, cache_dir)
+    return result
+
+def fetch_sources(sources:dict, cache_dir:str=None, max_age:dict=None, max_workers:int=FETCH_MAX_WORKERS):
+    # Download all sources concurrently, returns {key: FetchResult} in the order of sources
+    max_age = max_age or dict()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(sources)))) as executor:
+        futures = {key: executor.submit(fetch_source, source, cache_dir, max_age.get(key, 0)) for key, source in sources.items()}
+        return {key: future.result() for key, future in futures.items()}
@@ -0,0 +1,56 @@
+import io, csv, time
+import pandas as pd
+
+from settings import INGEST_CHUNK_ROWS
+from monitoring.metrics import DATA_LOAD_SECONDS
+
+# The US county files name their columns differently than the global ones
+COLUMN_ALIASES = {
+    'Country_Region':'Country/Region',
+    'Province_State':'Province/State',
+    'Long_':'Long',
+}
+# Header dates of the JHU time series, e.g. 1/22/20
+HEADER_DATE_FORMAT = '%m/%d/%y'
+
+def read_header(content:bytes):
+    # Column names of the first line only, normalized to the names of the global files
+    first_line = io.BytesIO(content).readline().decode('utf-8-sig')
+    return [COLUMN_ALIASES.get(column, column) for column in next(csv.reader([first_line]))]
+
+def split_header(header:list):
+    # Positions of the date columns and their DatetimeIndex, everything else is metadata
+    parsed = pd.to_datetime(pd.Series(header), format=HEADER_DATE_FORMAT, errors='coerce')
+    date_positions = [position for position, date in enumerate(parsed) if pd.notna(date)]
+    return date_positions, pd.DatetimeIndex(parsed.iloc[date_positions].to_numpy())
+
+def aggregate_time_series(content:bytes, group_columns=('Country/Region',), chunk_rows:int=INGEST_CHUNK_ROWS):
+    # Reads a wide JHU time series in chunks of chunk_rows rows, only the group columns (as strings) and the date
+    # columns (as float64) are parsed, Lat/Long/FIPS etc. are skipped by the parser. Every chunk is summed per group
+    # right away, so memory is bounded by the chunk and the number of groups, not by the number of rows.
+    # Returns a date x group frame, groups are sorted like groupby and missing provinces are kept as NaN keys
+    header = read_header(content)
+    date_positions, dates = split_header(header)
+    group_positions = [header.index(column) for column in group_columns]
+    dtypes = {position: 'float64' for position in date_positions}
+    dtypes.update({position: 'str' for position in group_positions})
+    parse_seconds = groupby_seconds = 0
+    partial_sums = []
+    start = time.perf_counter()
+    reader = pd.read_csv(io.BytesIO(content), header=0, names=header, usecols=group_positions + date_positions, dtype={header[position]: dtype for position, dtype in dtypes.items()}, chunksize=chunk_rows)
+    for chunk in reader:
+        parse_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        partial_sums.append(chunk.groupby(list(group_columns), sort=False, dropna=False).sum())
+        groupby_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+    start = time.perf_counter()
+    if not partial_sums:
+        return pd.DataFrame(index=dates, dtype='float64')
+    totals = pd.concat(partial_sums).groupby(level=list(range(len(group_columns))), dropna=False).sum() if len(partial_sums) > 1 else partial_sums[0].sort_index()
+    df = totals.T
+    df.index = dates
+    groupby_seconds += time.perf_counter() - start
+    DATA_LOAD_SECONDS.observe(parse_seconds, stage='parse')
+    DATA_LOAD_SECONDS.observe(groupby_seconds, stage='groupby')
+    return df
@@ -0,0 +1,44 @@
+# Validation of the query string arguments of the JSON and export routes, invalid values raise ValueError
+import pandas as pd
+
+def int_argument(args, name:str, default:int, minimum:int=1, maximum:int=None):
+    # Missing, None (a cleared dcc.Input) and empty values give the default
+    value = args.get(name)
+    try:
+        value = int(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be an integer')
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ValueError(f'{name} must be between {minimum} and {maximum}' if maximum is not None else f'{name} must be at least {minimum}')
+    return value
+
+def choice_argument(args, name:str, default:str, choices:list):
+    value = args.get(name, default)
+    if value not in choices:
+        raise ValueError(f'{name} must be one of {list(choices)}')
+    return value
+
+def regions_argument(args, dfs, name:str='region'):
+    regions = tuple(args.getlist(name))
+    unknown = [region for region in regions if region not in dfs.countries]
+    if unknown:
+        raise ValueError(f'unknown regions {unknown}')
+    return regions
+
+def date_argument(args, name:str, dates:pd.DatetimeIndex, default:int):
+    # Position of an ISO date in dates, dates outside the data are clipped to its first / last day
+    if not args.get(name):
+        return default
+    try:
+        date = pd.Timestamp(args.get(name))
+    except ValueError:
+        raise ValueError(f'{name} must be a date like 2020-03-01')
+    return int(min(dates.searchsorted(date), len(dates) - 1))
+
+def error_response(message:str, status_code:int=400, retry_after:int=None):
+    from flask import jsonify
+    response = jsonify({'error':message})
+    response.status_code = status_code
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(retry_after)
+    return response
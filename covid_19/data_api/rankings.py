@@ -0,0 +1,170 @@
+import numpy as np
+
+from settings import RANKING_MAX_RESULTS
+from data_api.regions import WORLD, REGION_LEVELS
+from data_api.query import int_argument, choice_argument, regions_argument, error_response
+from figures.rolling import moving_average
+
+RANKING_AGGREGATIONS = ['mean', 'last', 'max']
+RANKING_ORDERS = ['desc', 'asc']
+
+def region_mask(dfs, level:str='country', within:str=None):
+    # Boolean mask over dfs.countries: the regions of one level (World is never ranked) or the children of within
+    if within:
+        return np.fromiter((dfs.regions.parents.get(region) == within for region in dfs.countries), dtype=bool, count=len(dfs.countries))
+    if level == 'all':
+        return np.asarray(dfs.countries != WORLD)
+    depth = REGION_LEVELS.index(level)
+    levels = np.fromiter((dfs.regions.level(region) for region in dfs.countries), dtype='int64', count=len(dfs.countries))
+    return (levels == depth) & np.asarray(dfs.countries != WORLD)
+
+def trailing_window(values:np.ndarray, last_days:int, averaging_days:int):
+    # The averaged rows of the last last_days days for every region at once, only the rows the windows reach are touched
+    block = moving_average(values[-(last_days + averaging_days - 1):], averaging_days)
+    return block[-last_days:]
+
+def aggregate_window(block:np.ndarray, aggregation:str):
+    # Column-wise score of a window, NaN for regions without a single finite value
+    finite = np.isfinite(block)
+    counts = finite.sum(axis=0)
+    if aggregation == 'last':
+        return block[-1]
+    if aggregation == 'max':
+        scores = np.where(finite, block, -np.inf).max(axis=0)
+    else:
+        scores = np.where(finite, block, 0).sum(axis=0) / np.maximum(counts, 1)
+    return np.where(counts > 0, scores, np.nan)
+
+def top_n(scores:np.ndarray, n:int, ascending:bool=False):
+    # Positions of the n best finite scores in order, argpartition keeps this linear in the number of regions
+    candidates = np.flatnonzero(np.isfinite(scores))
+    keys = scores[candidates] if ascending else -scores[candidates]
+    if n < len(candidates):
+        selected = np.argpartition(keys, n - 1)[:n]
+        candidates, keys = candidates[selected], keys[selected]
+    return candidates[np.argsort(keys, kind='stable')]
+
+def rank_regions(dfs, selection:str, evaluation:str, n:int=10, last_days:int=14, averaging_days:int=7, aggregation:str='mean', order:str='desc', level:str='country', within:str=None):
+    # e.g. top n countries by the 7 day average of daily cases normalized over the last 14 days
+    data = dfs[selection][evaluation]['data']
+    last_days = min(last_days, len(dfs.dates))
+    values = data.to_numpy(dtype='float64')
+    scores = aggregate_window(trailing_window(values, last_days, averaging_days), aggregation)
+    scores[~region_mask(dfs, level, within)] = np.nan
+    positions = top_n(scores, min(n, RANKING_MAX_RESULTS), ascending=order == 'asc')
+    latest = values[-1, positions]
+    return {
+        'selection':selection,
+        'evaluation':evaluation,
+        'unit':dfs[selection][evaluation]['unit'],
+        'averaging_days':averaging_days,
+        'last_days':last_days,
+        'aggregation':aggregation,
+        'start_date':str(dfs.dates[-last_days].date()),
+        'end_date':str(dfs.dates[-1].date()),
+        'ranking':[
+            {'rank':rank, 'region':dfs.countries[position], 'score':float(score), 'latest':float(value) if np.isfinite(value) else None}
+            for rank, (position, score, value) in enumerate(zip(positions, scores[positions], latest), 1)
+        ],
+    }
+
+def first_crossing(values:np.ndarray, threshold:float):
+    # Row of the first value >= threshold per column via argmax over the boolean matrix, -1 where it is never reached
+    reached = values >= threshold
+    return np.where(reached.any(axis=0), reached.argmax(axis=0), -1)
+
+def align_since_threshold(dfs, selection:str, evaluation:str='cases', threshold:float=100, averaging_days:int=1, regions:list=None, level:str='country', within:str=None, max_days:int=None):
+    # Series of evaluation shifted to start on the day the cumulative cases of selection first reached threshold,
+    # the shift of all regions is one fancy index into the matrix. Regions that never reached it are left out
+    if regions:
+        columns = dfs.countries.get_indexer(regions)
+        if (columns < 0).any():
+            raise KeyError(f'unknown regions {[region for region, column in zip(regions, columns) if column < 0]}')
+    else:
+        columns = np.flatnonzero(region_mask(dfs, level, within))
+    starts = first_crossing(dfs[selection]['cases']['data'].to_numpy(dtype='float64')[:, columns], threshold)
+    columns, starts = columns[starts >= 0], starts[starts >= 0]
+    series = moving_average(dfs[selection][evaluation]['data'].to_numpy(dtype='float64')[:, columns], averaging_days)
+    n_dates = len(dfs.dates)
+    n_days = n_dates - starts.min() if len(starts) else 0
+    if max_days:
+        n_days = min(n_days, max_days)
+    rows = starts[None, :] + np.arange(n_days)[:, None]
+    aligned = np.where(rows < n_dates, series[np.minimum(rows, n_dates - 1), np.arange(len(columns))[None, :]], np.nan)
+    return {
+        'selection':selection,
+        'evaluation':evaluation,
+        'unit':dfs[selection][evaluation]['unit'],
+        'threshold':threshold,
+        'averaging_days':averaging_days,
+        'days':int(n_days),
+        'regions':[dfs.countries[column] for column in columns],
+        'start_dates':[str(dfs.dates[start].date()) for start in starts],
+        'values':aligned,
+    }
+
+def parse_query_arguments(args, dfs, kind:str):
+    # Validated keyword arguments of rank_regions / align_since_threshold from the query string, ValueError otherwise
+    arguments = dict(
+        selection=choice_argument(args, 'selection', 'confirmed', [selection for selection in dfs.selections if selection != 'time']),
+        level=choice_argument(args, 'level', 'country', REGION_LEVELS + ['all']),
+        within=args.get('within') or None,
+        averaging_days=int_argument(args, 'averaging_days', 7 if kind == 'ranking' else 1, maximum=len(dfs.dates)),
+    )
+    if arguments['within'] is not None and arguments['within'] not in dfs.countries:
+        raise ValueError(f"unknown region {arguments['within']}")
+    if kind == 'ranking':
+        arguments.update(
+            evaluation=choice_argument(args, 'evaluation', 'daily cases normalized', list(dfs[arguments['selection']])),
+            n=int_argument(args, 'n', 10, maximum=RANKING_MAX_RESULTS),
+            last_days=int_argument(args, 'last_days', 14, maximum=len(dfs.dates)),
+            aggregation=choice_argument(args, 'aggregation', 'mean', RANKING_AGGREGATIONS),
+            order=choice_argument(args, 'order', 'desc', RANKING_ORDERS),
+        )
+    else:
+        try:
+            threshold = float(args.get('threshold', 100))
+        except ValueError:
+            raise ValueError('threshold must be a number')
+        arguments.update(
+            evaluation=choice_argument(args, 'evaluation', 'cases', list(dfs[arguments['selection']])),
+            threshold=threshold,
+            regions=regions_argument(args, dfs),
+            max_days=int_argument(args, 'max_days', len(dfs.dates), maximum=len(dfs.dates)),
+        )
+    return arguments
+
+def get_ranking(state, cache, arguments:dict):
+    return cache.get_or_build(
+        (state.version, 'ranking', tuple(sorted(arguments.items()))),
+        lambda: rank_regions(state.dfs, **arguments),
+    )
+
+def get_alignment(state, cache, serializer, arguments:dict):
+    def build():
+        result = align_since_threshold(state.dfs, **arguments)
+        result['values'] = [serializer.encode_values(column) for column in result['values'].T]
+        return result
+    return cache.get_or_build((state.version, 'alignment', tuple(sorted(arguments.items()))), build)
+
+def register_ranking_api(server, data_store, cache, serializer, prefix:str='/api'):
+    # JSON routes on the flask server, results are cached per data version like the figures
+    from flask import request, jsonify
+
+    def respond(build):
+        state = data_store.current
+        if state is None:
+            return error_response('data is still loading', 503, retry_after=5)
+        try:
+            result = build(state)
+        except ValueError as error:
+            return error_response(str(error))
+        return jsonify({'data_version':state.version, **result})
+
+    @server.route(f'{prefix}/ranking')
+    def ranking_api():
+        return respond(lambda state: get_ranking(state, cache, parse_query_arguments(request.args, state.dfs, 'ranking')))
+
+    @server.route(f'{prefix}/alignment')
+    def alignment_api():
+        return respond(lambda state: get_alignment(state, cache, serializer, parse_query_arguments(request.args, state.dfs, 'alignment')))
@@ -0,0 +1,108 @@
+import threading, logging
+from collections import namedtuple
+
+from settings import DATA_REFRESH_INTERVAL, DATA_LOAD_RETRY_INTERVAL
+from data_api.snapshot import load_or_generate_dataframes_dict, load_cached_snapshot
+
+logger = logging.getLogger(__name__)
+
+DataState = namedtuple('DataState', ['countries', 'evaluation_options', 'dates', 'dfs', 'version'])
+
+class DataStore:
+    # Holds the current DataState, callbacks read store.current once and keep working on that state
+    # while a refresh builds the next one and swaps it in with a single reference assignment.
+    # current stays None until the first version is loaded, ready is set from then on
+    def __init__(self, load=load_or_generate_dataframes_dict, load_cached=load_cached_snapshot):
+        self.load = load
+        self.load_cached = load_cached
+        self.current = None
+        self.ready = threading.Event()
+        self.last_error = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        # callback(state) is called after every swap to a new data version
+        self._subscribers.append(callback)
+
+    def refresh(self, load=None):
+        # self.load(previous=dfs) gets the tree served so far to extend it incrementally
+        with self._refresh_lock:
+            previous = self.current
+            loaded = load() if load is not None else self.load(previous=previous and previous.dfs)
+            if loaded is None:
+                return False
+            countries, evaluation_options, dates, dfs = loaded
+            state = DataState(countries, evaluation_options, dates, dfs, dfs.data_version)
+            if previous is not None:
+                if dfs.data_version == previous.dfs.data_version:
+                    return False
+                if previous.dfs.is_extended_by(dfs):
+                    # Only the newly appended days get evaluated for the frames that were already cached
+                    dfs.extend_cache_from(previous.dfs)
+            self.current = state
+            self.ready.set()
+            logger.info('data version %s with %d days loaded', state.version, len(dates))
+        for callback in self._subscribers:
+            callback(state)
+        return True
+
+    def publish_model_frames(self, dfs, frames:dict, model_name:str):
+        # Adds fitted model frames to the current tree, the version changes so caches and pages pick them up
+        with self._refresh_lock:
+            if self.current is None or self.current.dfs is not dfs:
+                return False
+            dfs.set_model_frames(frames)
+            self.current = self.current._replace(version=f'{dfs.data_version}-{model_name}')
+            return True
+
+    def wait_ready(self, timeout:float=None):
+        return self.ready.wait(timeout)
+
+    def load_initial(self):
+        # A cached snapshot of any age is served first, then the regular load brings it up to date.
+        # Until one of them succeeds the load is retried with a growing delay instead of hammering the upstream
+        if self.load_cached is not None:
+            try:
+                self.refresh(self.load_cached)
+            except Exception:
+                logger.exception('loading the cached snapshot failed')
+        retry_interval = DATA_LOAD_RETRY_INTERVAL
+        while True:
+            try:
+                self.refresh()
+                self.last_error = None
+                return True
+            except Exception as error:
+                self.last_error = repr(error)
+                if self.ready.is_set():
+                    logger.exception('initial data load failed, keeping the cached data version %s', self.current.version)
+                    return True
+                logger.exception('initial data load failed, retrying in %d seconds', retry_interval)
+            if self._stop.wait(retry_interval):
+                return False
+            retry_interval = min(retry_interval * 2, max(DATA_REFRESH_INTERVAL, DATA_LOAD_RETRY_INTERVAL))
+
+    def _run(self, interval:float):
+        if not self.ready.is_set() and not self.load_initial():
+            return
+        if interval <= 0:
+            return
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('background data refresh failed, keeping data version %s', self.current and self.current.version)
+
+    def start_background_refresh(self, interval:float=DATA_REFRESH_INTERVAL):
+        # Loads the first data version unless there is one, then checks for new data every interval seconds
+        if (interval <= 0 and self.ready.is_set()) or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name='data-refresh', daemon=True)
+        self._thread.start()
+
+    def stop_background_refresh(self):
+        self._stop.set()
@@ -0,0 +1,126 @@
+from collections import defaultdict
+import pandas as pd
+
+WORLD = 'World'
+REGION_SEPARATOR = ' / '
+REGION_LEVELS = ['country', 'province', 'county']
+
+# Names restcountries.eu uses for Johns Hopkins regions, only used to look up their population
+POPULATION_NAME_ALIASES = {
+    'Bolivia':'Bolivia (Plurinational State of)',
+    'Brunei':'Brunei Darussalam',
+    'Burma':'Myanmar',
+    'Congo (Brazzaville)':'Congo',
+    'Congo (Kinshasa)':'Congo (Democratic Republic of the)',
+    "Cote d'Ivoire":"C\u00f4te d'Ivoire",
+    'Czechia':'Czech Republic',
+    'Eswatini':'Swaziland',
+    'Iran':'Iran (Islamic Republic of)',
+    'Korea, South':'Korea (Republic of)',
+    'Kosovo':'Republic of Kosovo',
+    'Laos':"Lao People's Democratic Republic",
+    'Moldova':'Moldova (Republic of)',
+    'North Macedonia':'Macedonia (the former Yugoslav Republic of)',
+    'Russia':'Russian Federation',
+    'Syria':'Syrian Arab Republic',
+    'Taiwan*':'Taiwan',
+    'Tanzania':'Tanzania, United Republic of',
+    'United Kingdom':'United Kingdom of Great Britain and Northern Ireland',
+    'Venezuela':'Venezuela (Bolivarian Republic of)',
+    'Vietnam':'Viet Nam',
+    'West Bank and Gaza':'Palestine, State of',
+}
+
+def population_key(region:str):
+    # Key of region in the lower cased {name: population} dict of restcountries.eu
+    return POPULATION_NAME_ALIASES.get(region, region).lower()
+
+def region_name(parts):
+    return REGION_SEPARATOR.join(str(part) for part in parts)
+
+def aggregate_regions(df:pd.DataFrame, aliases:dict=None, min_depth:int=1):
+    # df holds the finest rows of a file as date x (country, province, ...) columns, NaN where a row has no
+    # deeper level (e.g. mainland France). Every level from min_depth down is summed once here: countries over all
+    # their rows, provinces over their counties. Returns the date x region frame and {region: parent region}
+    aliases = aliases or dict()
+    keys = df.columns.to_frame(index=False)
+    n_levels = keys.shape[1]
+    frames, parents = [], dict()
+    for depth in range(min_depth, n_levels + 1):
+        rows = keys.iloc[:, depth - 1].notna().to_numpy()
+        if not rows.any():
+            continue
+        # Grouped on the original names, so countries keep the order of the former groupby('Country/Region')
+        group_keys = [keys.iloc[:, level].to_numpy()[rows] for level in range(depth)]
+        aggregated = df.loc[:, rows].T.groupby(group_keys, sort=True).sum().T
+        names = []
+        for key in aggregated.columns:
+            parts = [aliases.get(key[0], key[0]) if depth > 1 else aliases.get(key, key), *(key[1:] if depth > 1 else [])]
+            names.append(region_name(parts))
+            if depth > 1:
+                parents[names[-1]] = region_name(parts[:-1])
+        aggregated.columns = names
+        frames.append(aggregated)
+    return pd.concat(frames, axis=1), parents
+
+class RegionHierarchy:
+    # world -> country -> province -> county, parents holds every sub-national region, countries have no entry
+    def __init__(self, parents:dict=None):
+        self.parents = dict(parents or dict())
+        self._children = defaultdict(list)
+        for region, parent in self.parents.items():
+            self._children[parent].append(region)
+
+    def children(self, region:str):
+        return self._children.get(region, [])
+
+    def has_children(self, region:str):
+        return region in self._children
+
+    def ancestors(self, region:str):
+        ancestors = []
+        while region in self.parents:
+            region = self.parents[region]
+            ancestors.append(region)
+        return ancestors
+
+    def level(self, region:str):
+        return len(self.ancestors(region))
+
+    def top_level(self, regions):
+        return [region for region in regions if region not in self.parents]
+
+    def expand(self, regions, selected):
+        # Regions offered for selection: all countries plus the sub-regions of every selected region and of its
+        # ancestors, each listed right after its parent. Selecting a country drills down into its provinces
+        opened = set()
+        for region in selected or []:
+            opened.add(region)
+            opened.update(self.ancestors(region))
+        result = []
+        def visit(region):
+            result.append(region)
+            if region in opened:
+                for child in self.children(region):
+                    visit(child)
+        for region in self.top_level(regions):
+            visit(region)
+        return result
+
+def union_columns(frames):
+    # Columns of all frames in first seen order
+    seen = dict()
+    for df in frames:
+        seen.update(dict.fromkeys(df.columns))
+    return pd.Index(list(seen))
+
+def align_regions(base_frames:dict):
+    # Datasets can cover different provinces (e.g. no county files for recovered), missing regions become NaN
+    columns = union_columns(base_frames.values())
+    return {selection: df.reindex(columns=columns) if not df.columns.equals(columns) else df for selection, df in base_frames.items()}
+
+def add_world(df:pd.DataFrame, parents:dict):
+    # World is the sum of the countries only, adding provinces would count them twice
+    countries = [column for column in df.columns if column not in parents]
+    df.insert(len(countries), WORLD, df[countries].sum(axis=1))
+    return df
@@ -0,0 +1,183 @@
+import os, json, time, shutil, fcntl
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+from settings import SNAPSHOT_DIR, SNAPSHOT_REUSE_AGE, SNAPSHOT_PUBLISH_EVALUATIONS, DATA_SOURCE, REGION_LEVEL, DATA_STORAGE
+from data_api.apis import generate_dataframes_dict
+from data_api.evaluations import DatasetTree, EVALUATIONS, TIME_SELECTION, MODEL_DATASETS, frame_view
+
+# Bump whenever the layout of the snapshot or of the dfs tree changes
+SNAPSHOT_FORMAT_VERSION = 8
+CUBE_NAME = 'cube.npy'
+MANIFEST_NAME = 'manifest.json'
+CURRENT_POINTER_NAME = 'CURRENT'
+LOCK_NAME = '.lock'
+# Settings the tree depends on, a snapshot written with different ones is regenerated like one of another format
+SNAPSHOT_CONFIG = {'data_source':DATA_SOURCE, 'region_level':REGION_LEVEL, 'storage':DATA_STORAGE}
+
+@contextmanager
+def snapshot_lock(snapshot_dir:str):
+    # Only one worker computes the tree, the others block here and pick up its result
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with open(os.path.join(snapshot_dir, LOCK_NAME), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def save_snapshot(snapshot_dir:str, list_of_avaliable_countries, evaluation_options, list_of_available_dates, dfs, publish_evaluations:bool=SNAPSHOT_PUBLISH_EVALUATIONS):
+    # The downloaded cumulative frames are always stored, with publish_evaluations every dataset x evaluation
+    # matrix is published as well so workers map them instead of each computing a private copy
+    data_version = dfs.data_version
+    name = f'v{SNAPSHOT_FORMAT_VERSION}-{data_version}-{int(time.time())}'
+    tmp_dir = os.path.join(snapshot_dir, f'.{name}.{os.getpid()}.tmp')
+    os.makedirs(tmp_dir)
+    frames = []
+    if dfs.cube is not None:
+        # Compact trees store their cube as is, every dataset is one layer of it
+        np.save(os.path.join(tmp_dir, CUBE_NAME), dfs.cube)
+        frames = [{'selection':selection, 'file':CUBE_NAME, 'layer':layer, 'columns':list(dfs.countries)} for layer, selection in enumerate(dfs.base_frames)]
+    else:
+        for selection, df in dfs.base_frames.items():
+            file_name = f'{selection}.npy'
+            np.save(os.path.join(tmp_dir, file_name), df.to_numpy(dtype='float64'))
+            frames.append({'selection':selection, 'file':file_name, 'columns':list(df.columns)})
+    published = []
+    if publish_evaluations:
+        for selection in dfs:
+            if selection == TIME_SELECTION or selection in MODEL_DATASETS:
+                continue
+            for evaluation in EVALUATIONS:
+                if selection in dfs.base_frames and evaluation == 'cases':
+                    continue
+                df = dfs.get_data(selection, evaluation)
+                file_name = f'{selection}.{evaluation}.npy'.replace(' ', '_')
+                np.save(os.path.join(tmp_dir, file_name), df.to_numpy(dtype=dfs.evaluation_dtype))
+                published.append({'selection':selection, 'evaluation':evaluation, 'file':file_name, 'columns':list(df.columns)})
+    manifest = {
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'config': SNAPSHOT_CONFIG,
+        'storage': dfs.storage,
+        'data_version': data_version,
+        'created_at': time.time(),
+        'countries': list(list_of_avaliable_countries),
+        'evaluation_options': list(evaluation_options),
+        'evaluations': {key: {'unit':evaluation.unit, 'tool_tip':evaluation.tool_tip} for key, evaluation in EVALUATIONS.items()},
+        'dates': [date.isoformat() for date in list_of_available_dates],
+        'country_population': dfs.country_population_dict,
+        'region_parents': dfs.regions.parents,
+        'frames': frames,
+        'published': published,
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(tmp_dir, os.path.join(snapshot_dir, name))
+    pointer_tmp = os.path.join(snapshot_dir, f'.{CURRENT_POINTER_NAME}.{os.getpid()}.tmp')
+    with open(pointer_tmp, 'w') as pointer_file:
+        pointer_file.write(name)
+    os.replace(pointer_tmp, os.path.join(snapshot_dir, CURRENT_POINTER_NAME))
+    prune_snapshots(snapshot_dir, keep=name)
+    return name
+
+def prune_snapshots(snapshot_dir:str, keep:str):
+    # Workers still mapping an old snapshot keep their pages alive after unlinking
+    for name in os.listdir(snapshot_dir):
+        if name.startswith('v') and name != keep:
+            shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+
+def map_frame(path:str, frame:dict, dates:pd.DatetimeIndex):
+    return pd.DataFrame(np.load(os.path.join(path, frame['file']), mmap_mode='r'), index=dates, columns=frame['columns'], copy=False)
+
+def read_manifest(snapshot_dir:str):
+    # Path and manifest of the current snapshot, None without a readable one
+    try:
+        with open(os.path.join(snapshot_dir, CURRENT_POINTER_NAME)) as pointer_file:
+            path = os.path.join(snapshot_dir, pointer_file.read().strip())
+        with open(os.path.join(path, MANIFEST_NAME)) as manifest_file:
+            return path, json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+def is_compatible(manifest:dict):
+    return manifest.get('format_version') == SNAPSHOT_FORMAT_VERSION and manifest.get('config') == SNAPSHOT_CONFIG
+
+def touch_snapshot(snapshot_dir:str, data_version:str):
+    # Marks the current snapshot as revalidated if it holds data_version, returns False otherwise
+    current = read_manifest(snapshot_dir)
+    if current is None or not is_compatible(current[1]) or current[1]['data_version'] != data_version:
+        return False
+    path, manifest = current
+    manifest['created_at'] = time.time()
+    manifest_tmp = os.path.join(path, f'.{MANIFEST_NAME}.{os.getpid()}.tmp')
+    with open(manifest_tmp, 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(manifest_tmp, os.path.join(path, MANIFEST_NAME))
+    return True
+
+def load_snapshot(snapshot_dir:str, max_age:float=SNAPSHOT_REUSE_AGE):
+    current = read_manifest(snapshot_dir)
+    if current is None:
+        return None
+    path, manifest = current
+    if not is_compatible(manifest):
+        return None
+    if max_age is not None and time.time() - manifest['created_at'] > max_age:
+        return None
+
+    dates = pd.DatetimeIndex(manifest['dates'])
+    # Read-only memory maps, the pages are shared between all workers via the page cache
+    # and the DataFrames are zero-copy views onto them. The files may have been pruned by another
+    # worker since the manifest was read, the caller then regenerates
+    try:
+        published_frames = {(frame['selection'], frame['evaluation']): map_frame(path, frame, dates) for frame in manifest['published']}
+        if manifest['storage'] == 'compact':
+            cube = np.load(os.path.join(path, CUBE_NAME), mmap_mode='r')
+            countries = pd.Index(manifest['frames'][0]['columns'])
+            base_frames = {frame['selection']: frame_view(cube, frame['layer'], dates, countries) for frame in manifest['frames']}
+            dfs = DatasetTree(base_frames, manifest['country_population'], data_version=manifest['data_version'], published_frames=published_frames, storage='compact', cube=cube, region_parents=manifest['region_parents'])
+        else:
+            base_frames = {frame['selection']: map_frame(path, frame, dates) for frame in manifest['frames']}
+            dfs = DatasetTree(base_frames, manifest['country_population'], data_version=manifest['data_version'], published_frames=published_frames, storage='frames', region_parents=manifest['region_parents'])
+    except (OSError, ValueError):
+        return None
+    return (pd.Index(manifest['countries']), manifest['evaluation_options'], dates, dfs)
+
+def extend_generated(generated, previous):
+    # If the new download only appends days to the tree served so far, its published and cached frames are
+    # extended by the new rows, so publishing the snapshot evaluates the appended days only
+    dfs = generated[3]
+    if previous is not None and previous.is_extended_by(dfs):
+        dfs.extend_cache_from(previous)
+    return generated
+
+def load_or_generate_dataframes_dict(snapshot_dir:str=SNAPSHOT_DIR, max_age:float=SNAPSHOT_REUSE_AGE, generate=generate_dataframes_dict, previous=None):
+    # previous is the tree currently served, if any. A snapshot older than max_age is revalidated: one worker
+    # downloads (conditional GETs, mostly 304s) and only publishes a new snapshot if the data changed
+    if not snapshot_dir:
+        return generate()
+    loaded = load_snapshot(snapshot_dir, max_age)
+    if loaded is not None:
+        return loaded
+    with snapshot_lock(snapshot_dir):
+        # Another worker may have finished the computation while we waited for the lock
+        loaded = load_snapshot(snapshot_dir, max_age)
+        if loaded is not None:
+            return loaded
+        generated = generate()
+        loaded = load_snapshot(snapshot_dir, max_age=None) if touch_snapshot(snapshot_dir, generated[3].data_version) else None
+        if loaded is not None:
+            return loaded
+        save_snapshot(snapshot_dir, *extend_generated(generated, previous))
+    return load_snapshot(snapshot_dir, max_age=None) or generated
+
+def load_cached_snapshot(snapshot_dir:str=SNAPSHOT_DIR):
+    # Whatever snapshot is there regardless of its age, lets a restarting server answer before the next download
+    if not snapshot_dir:
+        return None
+    return load_snapshot(snapshot_dir, max_age=None)
+
+# Run as a separate loader process (python -m data_api.snapshot) to publish a fresh snapshot for all workers
+if __name__ == '__main__':
+    load_or_generate_dataframes_dict(max_age=0)
@@ -0,0 +1,121 @@
+import os, pickle, hashlib, threading
+from collections import OrderedDict
+
+from settings import FIGURE_CACHE_SIZE, FIGURE_CACHE_DIR
+
+# Arguments that don't influence the figure of a 'time' axis
+TIME_AXIS_IGNORED_ARGUMENTS = ['data_evaluation_value', 'type_value', 'averaging_days']
+
+def normalize_graph_arguments(country_selection_value, range_slider_value, yaxis_data_selection_value, xaxis_data_selection_value, yaxis_data_evaluation_value, xaxis_data_evaluation_value, yaxis_type_value, xaxis_type_value, yaxis_averaging_days, xaxis_averaging_days, **kwargs):
+    # Hashable representation of the graph callback arguments, equivalent views map to the same key
+    arguments = dict(
+        country_selection_value=tuple(country_selection_value or ()),
+        range_slider_value=tuple(int(value) for value in range_slider_value),
+        yaxis_data_selection_value=yaxis_data_selection_value,
+        xaxis_data_selection_value=xaxis_data_selection_value,
+        yaxis_data_evaluation_value=yaxis_data_evaluation_value,
+        xaxis_data_evaluation_value=xaxis_data_evaluation_value,
+        yaxis_type_value=yaxis_type_value,
+        xaxis_type_value=xaxis_type_value,
+        yaxis_averaging_days=int(yaxis_averaging_days),
+        xaxis_averaging_days=int(xaxis_averaging_days),
+    )
+    for axis in ['yaxis', 'xaxis']:
+        if arguments[f'{axis}_data_selection_value'] == 'time':
+            for argument in TIME_AXIS_IGNORED_ARGUMENTS:
+                arguments[f'{axis}_{argument}'] = None
+    return tuple(sorted(arguments.items()))
+
+def normalize_series_arguments(country_selection_value, yaxis_data_selection_value, xaxis_data_selection_value, yaxis_data_evaluation_value, xaxis_data_evaluation_value, **kwargs):
+    # Hashable representation of the arguments that select the series shipped to the clientside graph
+    arguments = dict(
+        country_selection_value=tuple(country_selection_value or ()),
+        yaxis_data_selection_value=yaxis_data_selection_value,
+        xaxis_data_selection_value=xaxis_data_selection_value,
+        yaxis_data_evaluation_value=None if yaxis_data_selection_value == 'time' else yaxis_data_evaluation_value,
+        xaxis_data_evaluation_value=None if xaxis_data_selection_value == 'time' else xaxis_data_evaluation_value,
+    )
+    return tuple(sorted(arguments.items()))
+
+class FigureCache:
+    # Bounded LRU cache of built figures, keyed by the data version and the normalized callback arguments.
+    # With a cache_dir the entries are also shared with the other workers through pickled files
+    def __init__(self, max_size:int=FIGURE_CACHE_SIZE, cache_dir:str=FIGURE_CACHE_DIR):
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._shared_version = None
+        self._lock = threading.Lock()
+
+    def make_key(self, data_version:str, **graph_arguments):
+        return (data_version, normalize_graph_arguments(**graph_arguments))
+
+    def make_series_key(self, data_version:str, **series_arguments):
+        return (data_version, 'series', normalize_series_arguments(**series_arguments))
+
+    def _shared_path(self, key):
+        data_version = key[0]
+        return os.path.join(self.cache_dir, f"{data_version}-{hashlib.sha1(repr(key).encode('utf-8')).hexdigest()}.pickle")
+
+    def _prune_shared(self, data_version:str):
+        # Figures of older data versions are never requested again
+        for name in os.listdir(self.cache_dir):
+            if not name.startswith(f'{data_version}-'):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def _get_shared(self, key):
+        try:
+            with open(self._shared_path(key), 'rb') as cache_file:
+                return pickle.load(cache_file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def _set_shared(self, key, value):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if self._shared_version != key[0]:
+            self._prune_shared(key[0])
+            self._shared_version = key[0]
+        path = self._shared_path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as cache_file:
+            pickle.dump(value, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        value = self._get_shared(key) if self.cache_dir else None
+        if value is None:
+            value = build()
+            if self.cache_dir:
+                self._set_shared(key, value)
+            with self._lock:
+                self.misses += 1
+        else:
+            with self._lock:
+                self.hits += 1
+        self._remember(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits':self.hits, 'misses':self.misses, 'size':len(self._entries), 'max_size':self.max_size}
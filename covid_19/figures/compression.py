@@ -0,0 +1,111 @@
+import gzip, zlib, threading
+from collections import OrderedDict
+
+from settings import COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE, COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY, COMPRESSION_STATIC_GZIP_LEVEL, COMPRESSION_STATIC_BROTLI_QUALITY, COMPRESSION_STATIC_CACHE_SIZE
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content-Encodings in order of preference, brotli only when the package is installed
+ENCODINGS = ['br', 'gzip'] if brotli is not None else ['gzip']
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/javascript', 'text/javascript', 'text/css', 'text/html', 'text/plain', 'text/csv', 'image/svg+xml', 'image/x-icon', 'image/vnd.microsoft.icon'}
+# Fingerprinted assets (?m=<mtime>) never change under their url
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def compress(body:bytes, encoding:str, static:bool=False):
+    # Responses that are compressed once and cached use the highest levels, per request ones the fast levels
+    if encoding == 'br':
+        return brotli.compress(body, quality=COMPRESSION_STATIC_BROTLI_QUALITY if static else COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, COMPRESSION_STATIC_GZIP_LEVEL if static else COMPRESSION_GZIP_LEVEL)
+
+def choose_encoding(request):
+    accepted = [encoding for encoding in ENCODINGS if request.accept_encodings[encoding]]
+    return accepted[0] if accepted else None
+
+def encoded_etag(etag:str, encoding:str=None):
+    # A strong ETag identifies one representation, so every Content-Encoding gets its own tag
+    return f'{etag}+{encoding}' if encoding else etag
+
+def etag_matches(etag:str, request):
+    return any(request.if_none_match.contains(encoded_etag(etag, encoding)) for encoding in [None, *ENCODINGS])
+
+def not_modified(response):
+    # 304 carrying the validators and caching headers of the response it replaces
+    from flask import Response
+    not_modified_response = Response(status=304)
+    for header in ['ETag', 'Cache-Control', 'Vary', 'Expires']:
+        if header in response.headers:
+            not_modified_response.headers[header] = response.headers[header]
+    return not_modified_response
+
+class StaticCompressionCache:
+    # Compressed bodies of responses that are the same on every request (component suites, assets, dependencies),
+    # keyed by path, checksum and encoding so the big javascript bundles are compressed only once per worker
+    def __init__(self, max_size:int=COMPRESSION_STATIC_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path:str, body:bytes, encoding:str):
+        key = (path, len(body), zlib.crc32(body), encoding)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        compressed = compress(body, encoding, static=True)
+        with self._lock:
+            self._entries[key] = compressed
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return compressed
+
+def init_http_caching(server, dash_app, enabled:bool=COMPRESSION_ENABLED, min_size:int=COMPRESSION_MIN_SIZE):
+    # ETag and Cache-Control for the dash endpoints and assets, revalidation with 304 and brotli/gzip compression
+    # of everything bigger than min_size. Must be registered after instrument_server, flask runs the after_request
+    # hooks in reverse order and the metrics should see the compressed sizes
+    from flask import request
+    static_cache = StaticCompressionCache()
+    prefix = dash_app.config.routes_pathname_prefix
+    dependencies_endpoint = f'{prefix}_dash-dependencies'
+    assets_endpoint = f"{prefix.replace('/', '_')}dash_assets.static"
+    suites_path = f'{prefix}_dash-component-suites/'
+
+    def compressible(response):
+        return enabled and 'Content-Encoding' not in response.headers and response.mimetype in COMPRESSIBLE_MIMETYPES
+
+    @server.after_request
+    def cache_and_compress(response):
+        if request.method not in ('GET', 'POST') or response.status_code != 200:
+            return response
+        if request.endpoint == dependencies_endpoint:
+            # The callbacks are registered at import, the content only changes with a deploy
+            response.add_etag()
+            response.headers['Cache-Control'] = 'no-cache'
+        elif request.endpoint == assets_endpoint:
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if request.args.get('m') else 'no-cache'
+        etag, weak = response.get_etag()
+        etag = etag if not weak else None
+        encoding = None
+        if compressible(response):
+            encoding = choose_encoding(request)
+            response.vary.add('Accept-Encoding')
+        if etag is not None and request.method == 'GET' and etag_matches(etag, request):
+            if encoding is not None and (response.calculate_content_length() or min_size) >= min_size:
+                response.set_etag(encoded_etag(etag, encoding))
+            return not_modified(response)
+        if encoding is None or response.is_streamed and not response.direct_passthrough:
+            # Generators like the export route are passed through as they are produced
+            return response
+        response.direct_passthrough = False
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+        # Bodies with a strong ETag and the fingerprinted component suites are the same on every request
+        static = etag is not None or request.path.startswith(suites_path)
+        response.set_data(static_cache.get(request.path, body, encoding) if static else compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+        if etag is not None:
+            response.set_etag(encoded_etag(etag, encoding))
+        return response
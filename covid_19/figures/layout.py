@@ -0,0 +1,63 @@
+import json, hashlib, threading
+from collections import namedtuple
+import dash
+import flask
+import plotly
+
+from settings import COMPRESSION_ENABLED
+from figures.compression import ENCODINGS, compress, choose_encoding, encoded_etag, etag_matches
+
+# encoded: Content-Encoding -> body compressed with the static levels
+RenderedLayout = namedtuple('RenderedLayout', ['version', 'etag', 'body', 'encoded'])
+
+class LayoutCache:
+    # The layout of the current data version as JSON, rendered and compressed once instead of on every page load
+    def __init__(self, encodings:list=ENCODINGS if COMPRESSION_ENABLED else []):
+        self.encodings = encodings
+        self._rendered = None
+        self._lock = threading.Lock()
+
+    def get(self, version:str, build):
+        rendered = self._rendered
+        if rendered is not None and rendered.version == version:
+            return rendered
+        with self._lock:
+            if self._rendered is None or self._rendered.version != version:
+                body = json.dumps(build(), cls=plotly.utils.PlotlyJSONEncoder).encode('utf-8')
+                etag = f"{version}-{hashlib.sha1(body).hexdigest()[:16]}"
+                self._rendered = RenderedLayout(version, etag, body, {encoding: compress(body, encoding, static=True) for encoding in self.encodings})
+            return self._rendered
+
+    def clear(self):
+        with self._lock:
+            self._rendered = None
+
+def rendered_response(rendered:RenderedLayout, mimetype:str='application/json'):
+    # Strong ETag per data version and encoding: browsers revalidate every load (the URL never changes) and get a 304
+    request = flask.request
+    encoding = choose_encoding(request)
+    encoding = encoding if encoding in rendered.encoded else None
+    headers = {'ETag': f'"{encoded_etag(rendered.etag, encoding)}"', 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if etag_matches(rendered.etag, request):
+        return flask.Response(status=304, headers=headers)
+    if encoding is None:
+        return flask.Response(rendered.body, mimetype=mimetype, headers=headers)
+    response = flask.Response(rendered.encoded[encoding], mimetype=mimetype, headers=headers)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+class CachedLayoutDash(dash.Dash):
+    # Dash app serving /_dash-layout from a LayoutCache. layout_version() returns the version the layout
+    # depends on, None (e.g. the placeholder while loading) renders and serves it uncached
+    def __init__(self, *args, layout_version=None, **kwargs):
+        self.layout_version = layout_version
+        self.layout_cache = LayoutCache()
+        super().__init__(*args, **kwargs)
+
+    def serve_layout(self):
+        version = self.layout_version() if self.layout_version is not None else None
+        if version is None:
+            response = super().serve_layout()
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        return rendered_response(self.layout_cache.get(version, self._layout_value))
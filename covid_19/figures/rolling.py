@@ -0,0 +1,131 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from settings import ROLLING_INDEX_CACHE_SIZE, ROLLING_INDEX_MAX_WINDOW
+
+def country_columns(data:pd.DataFrame, countries:list):
+    columns = data.columns.get_indexer(countries)
+    if (columns < 0).any():
+        missing = [country for country, column in zip(countries, columns) if column < 0]
+        raise KeyError(f'unknown countries {missing}')
+    return columns
+
+def select_block(data:pd.DataFrame, countries:list, range_slider_value:list):
+    # dates x countries block of the selected countries and slider range as one 2-D array
+    return data.to_numpy(dtype='float64')[range_slider_value[0] : range_slider_value[-1], country_columns(data, countries)]
+
+def _window_sums(values:np.ndarray, n_days:int):
+    # Sum over the trailing n_days rows for every row, the first n_days - 1 rows have no full window
+    cumulative = np.cumsum(values, axis=0, dtype='float64')
+    sums = np.empty_like(cumulative)
+    sums[:n_days - 1] = 0
+    sums[n_days - 1] = cumulative[n_days - 1]
+    sums[n_days:] = cumulative[n_days:] - cumulative[:-n_days]
+    return sums
+
+def moving_average(block:np.ndarray, n_days:int):
+    # Equivalent of DataFrame.rolling(n_days).mean() on every column at once, via cumulative sums.
+    # Like pandas, windows containing NaN or inf values are NaN
+    block = np.asarray(block, dtype='float64')
+    finite = np.isfinite(block)
+    if n_days <= 1:
+        return np.where(finite, block, np.nan)
+    result = np.full(block.shape, np.nan)
+    if len(block) < n_days:
+        return result
+    sums = _window_sums(np.where(finite, block, 0), n_days)
+    n_invalid = _window_sums(~finite, n_days)
+    valid = n_invalid[n_days - 1:] == 0
+    result[n_days - 1:][valid] = sums[n_days - 1:][valid] / n_days
+    return result
+
+class RollingIndex:
+    # Prefix sums of one frame, any trailing moving average is one subtraction per point. The means of the
+    # windows 2..max_window are materialized on first use into one float32 (window x date x country) cube,
+    # so a callback only slices and its cost no longer grows with the length of the history. Unaveraged values
+    # are read from the frame itself, which may be a shared memory map
+    def __init__(self, data:pd.DataFrame, max_window:int=ROLLING_INDEX_MAX_WINDOW):
+        self.data = data
+        self.max_window = max_window
+        values = data.to_numpy()
+        self.shape = values.shape
+        finite = np.isfinite(values)
+        # Non-finite rows before the first finite value of every column (the first row of a diff, columns
+        # without population), only columns with gaps after those keep prefix counts of their non-finite values
+        self._leading = np.where(finite.any(axis=0), finite.argmax(axis=0), len(values))
+        gaps = ~finite & (np.arange(len(values))[:, None] >= self._leading)
+        self._gap_columns = np.flatnonzero(gaps.any(axis=0))
+        self._gaps = np.zeros((len(values) + 1, len(self._gap_columns)), dtype='int32')
+        np.cumsum(gaps[:, self._gap_columns], axis=0, out=self._gaps[1:])
+        self._sums = np.zeros((len(values) + 1, values.shape[1]))
+        np.cumsum(np.where(finite, values, 0), axis=0, out=self._sums[1:])
+        self._cube = None
+        self._materialized = set()
+        self._lock = threading.Lock()
+
+    def window_means(self, n_days:int, start:int=0, end:int=None):
+        # Trailing n_days means of the rows start..end over the full history, NaN without a complete, finite window
+        end = self.shape[0] if end is None else end
+        first = max(start, n_days - 1)
+        result = np.full((end - start, self.shape[1]), np.nan)
+        if first >= end:
+            return result
+        valid = np.arange(first + 1 - n_days, end + 1 - n_days)[:, None] >= self._leading
+        if len(self._gap_columns):
+            valid[:, self._gap_columns] &= self._gaps[first + 1:end + 1] == self._gaps[first + 1 - n_days:end + 1 - n_days]
+        sums = self._sums[first + 1:end + 1] - self._sums[first + 1 - n_days:end + 1 - n_days]
+        result[first - start:] = np.where(valid, sums / n_days, np.nan)
+        return result
+
+    def _layer(self, n_days:int):
+        with self._lock:
+            if n_days not in self._materialized:
+                if self._cube is None:
+                    # Untouched layers of np.empty never get paged in
+                    self._cube = np.empty((self.max_window - 1, *self.shape), dtype='float32')
+                self._cube[n_days - 2] = self.window_means(n_days)
+                self._materialized.add(n_days)
+            return self._cube[n_days - 2]
+
+    def moving_average(self, countries:list, range_slider_value:list, n_days:int):
+        # Same result as moving_average(select_block(...), n_days): the first n_days - 1 days of the range are NaN
+        start, end = range_slider_value[0], range_slider_value[-1]
+        if n_days <= 1:
+            block = select_block(self.data, countries, range_slider_value)
+            return np.where(np.isfinite(block), block, np.nan)
+        columns = country_columns(self.data, countries)
+        if n_days > self.max_window:
+            block = self.window_means(n_days, start, end)[:, columns]
+        else:
+            block = self._layer(n_days)[start:end, columns].astype('float64')
+        block[:n_days - 1] = np.nan
+        return block
+
+class RollingIndexCache:
+    # Bounded LRU of RollingIndex per frame. Frames are immutable once built, the frame object itself is the key
+    # (kept referenced by the entry), so recomputed or republished frames get a fresh index
+    def __init__(self, max_size:int=ROLLING_INDEX_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, data:pd.DataFrame):
+        key = id(data)
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None and index.data is data:
+                self._entries.move_to_end(key)
+                return index
+        index = RollingIndex(data)
+        with self._lock:
+            self._entries[key] = index
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
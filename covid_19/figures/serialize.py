@@ -0,0 +1,42 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from settings import FIGURE_SIGNIFICANT_DIGITS
+
+class TraceSerializer:
+    # Turns trace data into plain lists that the JSON encoder handles on its fast path:
+    # dates as ISO strings encoded once per data version and date range, values rounded
+    # to a number of significant digits with NaN/inf replaced by None (null)
+    def __init__(self, significant_digits:int=FIGURE_SIGNIFICANT_DIGITS, date_cache_size:int=64):
+        self.significant_digits = significant_digits
+        self.date_cache_size = date_cache_size
+        self._date_cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode_dates(self, dfs, range_slider_value:list):
+        key = (dfs.data_version, range_slider_value[0], range_slider_value[-1])
+        with self._lock:
+            if key in self._date_cache:
+                self._date_cache.move_to_end(key)
+                return self._date_cache[key]
+        encoded = list(np.datetime_as_string(np.asarray(dfs.dates[range_slider_value[0] : range_slider_value[-1]], dtype='datetime64[D]')))
+        with self._lock:
+            self._date_cache[key] = encoded
+            while len(self._date_cache) > self.date_cache_size:
+                self._date_cache.popitem(last=False)
+        return encoded
+
+    def encode_values(self, values):
+        values = np.asarray(values, dtype='float64')
+        finite = np.isfinite(values)
+        rounded = values.copy()
+        if self.significant_digits:
+            magnitude = np.zeros_like(values)
+            nonzero = finite & (values != 0)
+            magnitude[nonzero] = np.floor(np.log10(np.abs(values[nonzero])))
+            scale = 10.0 ** (self.significant_digits - 1 - magnitude)
+            rounded[finite] = np.round(values[finite] * scale[finite]) / scale[finite]
+        encoded = rounded.astype(object)
+        encoded[~finite] = None
+        return encoded.tolist()
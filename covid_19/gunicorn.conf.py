@@ -0,0 +1,19 @@
+# Gunicorn settings, used by the Dockerfile
+import os
+
+bind = '0.0.0.0:8050'
+workers = int(os.environ.get('COVID_APP_WORKERS') or 2)
+
+# Import the app once in the master, the forked workers share those pages. The master loads no data:
+# threads don't survive the fork, so every worker starts its own background load (mapping the shared
+# snapshot, only one of them downloads) and serves a placeholder until it is ready
+preload_app = True
+os.environ.setdefault('COVID_APP_DATA_LOAD_ON_IMPORT', 'False')
+
+def post_fork(server, worker):
+    # Threads don't survive the fork, every worker runs its own load, refresh and fit threads
+    from app import data_store, sir_fit_service
+    from settings import SIR_FIT_ENABLED
+    data_store.start_background_refresh()
+    if SIR_FIT_ENABLED:
+        sir_fit_service.start()
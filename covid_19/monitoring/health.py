@@ -0,0 +1,21 @@
+import time
+
+def register_health_routes(server, data_store, liveness_route:str='/healthz', readiness_route:str='/readyz'):
+    # /healthz answers as soon as the process serves requests, /readyz only once a data version is loaded,
+    # so load balancers keep routing to the old instances while a new one is still downloading
+    from flask import jsonify
+    started_at = time.time()
+
+    @server.route(liveness_route)
+    def healthz():
+        return jsonify({'status':'ok', 'uptime':round(time.time() - started_at, 3)})
+
+    @server.route(readiness_route)
+    def readyz():
+        state = data_store.current
+        if state is None:
+            response = jsonify({'status':'loading', 'error':data_store.last_error})
+            response.status_code = 503
+            response.headers['Retry-After'] = '5'
+            return response
+        return jsonify({'status':'ready', 'data_version':state.version, 'days':len(state.dates), 'error':data_store.last_error})
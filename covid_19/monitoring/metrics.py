@@ -0,0 +1,176 @@
+import time, bisect, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+# Upper bounds of the histogram buckets, +Inf is added implicitly
+SECONDS_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = tuple(256 * 4**idx for idx in range(10))
+
+def _format_labels(label_names, label_values, extra:dict=None):
+    pairs = list(zip(label_names, label_values)) + list((extra or dict()).items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+class Counter:
+    def __init__(self, name:str, documentation:str, label_names=()):
+        self.name, self.documentation, self.label_names = name, documentation, tuple(label_names)
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def inc(self, amount:float=1, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}')
+        return lines
+
+class Histogram:
+    def __init__(self, name:str, documentation:str, label_names=(), buckets=SECONDS_BUCKETS):
+        self.name, self.documentation, self.label_names = name, documentation, tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, value:float, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, float('inf')), counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{_format_labels(self.label_names, key, {"le":_format_value(bound)})} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}')
+                lines.append(f'{self.name}_count{_format_labels(self.label_names, key)} {cumulative}')
+        return lines
+
+class Gauge:
+    # Read at scrape time, func returns {label values tuple: value}
+    def __init__(self, name:str, documentation:str, func, label_names=(), metric_type:str='gauge'):
+        self.name, self.documentation, self.func, self.label_names = name, documentation, func, tuple(label_names)
+        self.metric_type = metric_type
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        for key, value in sorted(self.func().items()):
+            lines.append(f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}')
+        return lines
+
+class Registry:
+    # Metrics of one worker process in the Prometheus text exposition format
+    def __init__(self):
+        self._metrics = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name:str, documentation:str, label_names=()):
+        return self.register(Counter(name, documentation, label_names))
+
+    def histogram(self, name:str, documentation:str, label_names=(), buckets=SECONDS_BUCKETS):
+        return self.register(Histogram(name, documentation, label_names, buckets))
+
+    def gauge(self, name:str, documentation:str, func, label_names=(), metric_type:str='gauge'):
+        return self.register(Gauge(name, documentation, func, label_names, metric_type))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+REGISTRY = Registry()
+
+DATA_LOAD_SECONDS = REGISTRY.histogram('covid_data_load_stage_seconds', 'Time spent per stage of loading the data', ['stage'])
+CALLBACK_SECONDS = REGISTRY.histogram('covid_callback_compute_seconds', 'Time spent in the dash callback functions', ['callback'])
+FIGURE_BUILD_SECONDS = REGISTRY.histogram('covid_figure_build_seconds', 'Time spent building figures and graph series', ['builder'])
+JSON_ENCODE_SECONDS = REGISTRY.histogram('covid_callback_encode_seconds', 'Time spent JSON encoding the callback responses', ['callback'])
+HTTP_REQUEST_SECONDS = REGISTRY.histogram('covid_http_request_seconds', 'Time spent handling http requests', ['endpoint'])
+HTTP_RESPONSE_BYTES = REGISTRY.histogram('covid_http_response_bytes', 'Size of the http responses', ['endpoint'], buckets=BYTES_BUCKETS)
+HTTP_REQUESTS = REGISTRY.counter('covid_http_requests_total', 'Number of handled http requests', ['endpoint', 'status'])
+
+_local = threading.local()
+
+def timed(histogram:Histogram, **labels):
+    # Decorator observing the duration of every call, the time also counts as callback compute time
+    # so instrument_callbacks can tell computing from encoding
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                histogram.observe(elapsed, **labels)
+                if histogram is CALLBACK_SECONDS:
+                    _local.compute_seconds = getattr(_local, 'compute_seconds', 0) + elapsed
+        return wrapper
+    return decorator
+
+def instrument_callbacks(dash_app):
+    # Dash wraps every callback into a function that calls it and JSON encodes the result,
+    # the encoding time is that wrapper's time minus the compute time recorded by @timed
+    for output, registration in dash_app.callback_map.items():
+        if 'callback' not in registration:
+            # Clientside callbacks never reach the server
+            continue
+        callback_name = getattr(registration['callback'], '__name__', output)
+        def instrumented(*args, _callback=registration['callback'], _name=callback_name):
+            _local.compute_seconds = 0
+            start = time.perf_counter()
+            response = _callback(*args)
+            JSON_ENCODE_SECONDS.observe(max(time.perf_counter() - start - _local.compute_seconds, 0), callback=_name)
+            return response
+        registration['callback'] = instrumented
+
+def instrument_server(server, registry:Registry=REGISTRY, route:str='/metrics'):
+    # Request timings and sizes for every route plus the /metrics route itself
+    from flask import request, g, Response
+
+    @server.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @server.after_request
+    def record_request(response):
+        start = getattr(g, 'metrics_start', None)
+        if start is not None:
+            endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+            if not response.direct_passthrough:
+                HTTP_RESPONSE_BYTES.observe(response.calculate_content_length() or 0, endpoint=endpoint)
+            HTTP_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+        return response
+
+    @server.route(route)
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,87 @@
+import os, sys, hmac, glob, time, random, threading
+from collections import Counter
+
+from settings import PROFILING_ENABLED, PROFILE_DIR, PROFILE_SAMPLE_INTERVAL, PROFILE_REQUEST_RATE, PROFILE_TOKEN, PROFILE_MAX_FILES
+
+PROFILE_HEADER = 'X-Covid-Profile'
+
+class SamplingProfiler:
+    # Samples the stack of one thread every interval seconds from a helper thread,
+    # the result is written in the collapsed format of flamegraph.pl and speedscope
+    def __init__(self, thread_id:int, interval:float=PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+            frame = frame.f_back
+        if stack:
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def dump(self, path:str):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as profile_file:
+            for stack, count in self.stacks.most_common():
+                profile_file.write(f'{stack} {count}\n')
+        os.replace(tmp_path, path)
+        return path
+
+def prune_profiles(profile_dir:str, max_files:int):
+    # Keeps the newest max_files profiles, files removed by another worker in the meantime are skipped
+    paths = sorted(glob.glob(os.path.join(profile_dir, '*.folded')), key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+    for path in paths[:max(len(paths) - max_files, 0)]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def instrument_profiling(server, profile_dir:str=PROFILE_DIR, request_rate:float=PROFILE_REQUEST_RATE, token:str=PROFILE_TOKEN, max_files:int=PROFILE_MAX_FILES):
+    # Opt-in: requests whose X-Covid-Profile header matches token (or a random share of request_rate) are sampled
+    # while they are handled and dumped to profile_dir as {time}-{pid}-{endpoint}.folded, without a token the
+    # header is ignored. Only the newest max_files profiles are kept
+    from flask import request, g
+
+    def authorized():
+        value = request.headers.get(PROFILE_HEADER)
+        return bool(token and value) and hmac.compare_digest(value.encode('utf-8'), token.encode('utf-8'))
+
+    @server.before_request
+    def start_profiler():
+        if authorized() or (request_rate and random.random() < request_rate):
+            g.profiler = SamplingProfiler(threading.get_ident()).start()
+
+    @server.teardown_request
+    def dump_profile(exception=None):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return
+        profiler.stop()
+        os.makedirs(profile_dir, exist_ok=True)
+        endpoint = (request.url_rule.rule if request.url_rule is not None else 'unmatched').strip('/').replace('/', '_') or 'index'
+        profiler.dump(os.path.join(profile_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{endpoint}.folded'))
+        prune_profiles(profile_dir, max_files)
+
+def init_profiling(server, enabled:bool=PROFILING_ENABLED):
+    if enabled:
+        instrument_profiling(server)
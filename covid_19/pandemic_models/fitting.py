@@ -0,0 +1,158 @@
+import os, json, threading, logging, fcntl
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from settings import SNAPSHOT_DIR, SIR_FIT_WORKERS, SIR_FIT_WINDOW_DAYS, SIR_FIT_MIN_INFECTED
+from pandemic_models.sir_model import solve_sir
+from data_api.evaluations import MODEL_DATASETS
+from data_api.regions import population_key
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'sir'
+MODEL_SELECTION = MODEL_DATASETS[0]
+# Basic reproduction numbers and recovery rates of the first, coarse grid; a = r0 * b / N0
+R0_GRID = np.linspace(.3, 6, 40)
+B_GRID = np.geomspace(.01, .5, 40)
+REFINEMENTS = 3
+STEPS_PER_DAY = 2
+
+def simulate(N0, I0, R0, a, b, n_days):
+    # Daily samples of I and R over n_days for all (a, b) scenarios at once
+    result = solve_sir(N0, I0, a, b, n_days - 1, R0=R0, samples=n_days - 1, steps=(n_days - 1) * STEPS_PER_DAY, method='rk4')
+    return result.I, result.R
+
+def fit_loss(N0, infected, recovered, r0, b):
+    I, R = simulate(N0, infected[0], recovered[0], r0 * b / N0, b, len(infected))
+    with np.errstate(invalid='ignore'):
+        error = (np.log1p(np.clip(I, 0, None)) - np.log1p(infected[:, None]))**2 + (np.log1p(np.clip(R, 0, None)) - np.log1p(recovered[:, None]))**2
+    return np.nan_to_num(error.mean(axis=0), nan=np.inf)
+
+def fit_sir(infected, recovered, N0, window_days:int=SIR_FIT_WINDOW_DAYS, min_infected:float=SIR_FIT_MIN_INFECTED):
+    # Least squares fit (on log scale) of the infection rate a and recovery rate b to the last window_days,
+    # a coarse grid over r0 and b is refined around the best point. Returns None if there is too little data
+    infected, recovered = np.asarray(infected, dtype='float64'), np.asarray(recovered, dtype='float64')
+    above_threshold = np.flatnonzero(np.isfinite(infected) & (infected >= min_infected))
+    if not N0 or not len(above_threshold):
+        return None
+    start = max(above_threshold[0], len(infected) - window_days)
+    infected, recovered = infected[start:], recovered[start:]
+    if len(infected) < 7 or not (np.isfinite(infected).all() and np.isfinite(recovered).all()):
+        return None
+
+    r0_grid, b_grid = R0_GRID, B_GRID
+    for _ in range(REFINEMENTS + 1):
+        r0, b = np.meshgrid(r0_grid, b_grid, indexing='ij')
+        loss = fit_loss(N0, infected, recovered, r0.ravel(), b.ravel()).reshape(r0.shape)
+        best_r0, best_b = np.unravel_index(np.argmin(loss), loss.shape)
+        r0_grid = np.linspace(r0_grid[max(best_r0 - 1, 0)], r0_grid[min(best_r0 + 1, len(r0_grid) - 1)], 9)
+        b_grid = np.linspace(b_grid[max(best_b - 1, 0)], b_grid[min(best_b + 1, len(b_grid) - 1)], 9)
+    r0_value, b_value = float(r0[best_r0, best_b]), float(b[best_r0, best_b])
+    I, _ = simulate(N0, infected[0], recovered[0], r0_value * b_value / N0, b_value, len(infected))
+    return {
+        'a':r0_value * b_value / N0,
+        'b':b_value,
+        'r0':r0_value,
+        'N0':float(N0),
+        'start':int(start),
+        'loss':float(loss[best_r0, best_b]),
+        'infected':I.tolist(),
+    }
+
+def _fit_country(arguments):
+    country, infected, recovered, N0 = arguments
+    return country, fit_sir(infected, recovered, N0)
+
+def fit_all_countries(dfs, max_workers:int=SIR_FIT_WORKERS):
+    # Fits every country with a known population in a process pool, returns {country: parameters}
+    infected = dfs['infected']['cases']['data']
+    recovered = dfs['recovered']['cases']['data']
+    tasks = []
+    for country in dfs.countries:
+        N0 = dfs.country_population_dict.get(population_key(country))
+        if N0:
+            tasks.append((country, infected[country].to_numpy(dtype='float64'), recovered[country].to_numpy(dtype='float64'), N0))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return {country: parameters for country, parameters in executor.map(_fit_country, tasks, chunksize=8) if parameters is not None}
+
+def build_model_frame(dfs, fitted_parameters:dict):
+    # Fitted infected counts on the date index of the tree, NaN outside the fit window
+    values = np.full((len(dfs.dates), len(dfs.countries)), np.nan)
+    columns = dfs.countries.get_indexer(list(fitted_parameters))
+    for column, parameters in zip(columns, fitted_parameters.values()):
+        values[parameters['start']:parameters['start'] + len(parameters['infected']), column] = parameters['infected']
+    return pd.DataFrame(values, index=dfs.dates, columns=dfs.countries)
+
+class SIRFitService:
+    # Fits the SIR model for every new data version in the background and publishes the fitted
+    # infected counts as the 'SIR infected' dataset. Fitted parameters are cached per data version
+    # in cache_dir, so only one worker runs the optimizer
+    def __init__(self, data_store, cache_dir:str=SNAPSHOT_DIR, max_workers:int=SIR_FIT_WORKERS):
+        self.data_store = data_store
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.fitted_parameters = dict()
+        self._pending = threading.Event()
+        self._thread = None
+        data_store.subscribe(lambda state: self._pending.set())
+
+    def _cache_path(self, data_version:str):
+        return os.path.join(self.cache_dir, f'{MODEL_NAME}-fit-{data_version}.json')
+
+    def _load_cached(self, data_version:str):
+        try:
+            with open(self._cache_path(data_version)) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+    def load_or_fit(self, dfs):
+        data_version = dfs.data_version
+        if data_version in self.fitted_parameters:
+            return self.fitted_parameters[data_version]
+        if not self.cache_dir:
+            parameters = fit_all_countries(dfs, self.max_workers)
+        else:
+            parameters = self._load_cached(data_version)
+            if parameters is None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with open(os.path.join(self.cache_dir, f'.{MODEL_NAME}-fit.lock'), 'w') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    parameters = self._load_cached(data_version)
+                    if parameters is None:
+                        parameters = fit_all_countries(dfs, self.max_workers)
+                        tmp_path = f'{self._cache_path(data_version)}.{os.getpid()}.tmp'
+                        with open(tmp_path, 'w') as cache_file:
+                            json.dump(parameters, cache_file)
+                        os.replace(tmp_path, self._cache_path(data_version))
+                        for name in os.listdir(self.cache_dir):
+                            if name.startswith(f'{MODEL_NAME}-fit-') and name != os.path.basename(self._cache_path(data_version)):
+                                os.remove(os.path.join(self.cache_dir, name))
+        self.fitted_parameters = {data_version: parameters}
+        return parameters
+
+    def fit_current(self):
+        state = self.data_store.current
+        if state is None:
+            return False
+        parameters = self.load_or_fit(state.dfs)
+        published = self.data_store.publish_model_frames(state.dfs, {MODEL_SELECTION: build_model_frame(state.dfs, parameters)}, MODEL_NAME)
+        logger.info('SIR fit of %d countries for data version %s published: %s', len(parameters), state.dfs.data_version, published)
+        return published
+
+    def _run(self):
+        while True:
+            self._pending.wait()
+            self._pending.clear()
+            try:
+                self.fit_current()
+            except Exception:
+                logger.exception('SIR fitting failed')
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._pending.set()
+        self._thread = threading.Thread(target=self._run, name='sir-fit', daemon=True)
+        self._thread.start()
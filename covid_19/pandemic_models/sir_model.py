@@ -1,3 +1,6 @@
+import numpy as np
+from collections import namedtuple
+
 def SIR(N0, I0, a, b, days, R0=0, samples=200, steps=10000):
     L, S, I, R = [], N0-R0-I0, I0, R0
     step, sampleStep = days/steps, steps //samples
@@ -7,4 +10,38 @@ def SIR(N0, I0, a, b, days, R0=0, samples=200, steps=10000):
             L.append((d,S,I,R))
         S, I = S*(1-a*I*step), I*(1+(a*S-b)*step)
         R = N0-S-I
-    return [list(map(lambda p: (p[0],p[k]),L)) for k in [1,2,3]]
\ No newline at end of file
+    return [list(map(lambda p: (p[0],p[k]),L)) for k in [1,2,3]]
+
+# Sample times with shape (samples,) and S, I, R with shape (samples, *scenario_shape)
+SIRResult = namedtuple('SIRResult', ['t', 'S', 'I', 'R'])
+
+SIR_METHODS = ['euler', 'rk4']
+
+def _sir_derivatives(S, I, a, b):
+    infections = a * S * I
+    return -infections, infections - b * I
+
+def solve_sir(N0, I0, a, b, days, R0=0, samples=200, steps=10000, method='euler'):
+    # Integrates all scenarios given by broadcasting N0, I0, a, b and R0 against each other at once.
+    # 'euler' reproduces SIR step by step, 'rk4' reaches the same accuracy with far fewer steps
+    if method not in SIR_METHODS:
+        raise ValueError(f'unknown method {method!r}, expected one of {SIR_METHODS}')
+    N0, I0, a, b, R0 = np.broadcast_arrays(*[np.asarray(value, dtype='float64') for value in (N0, I0, a, b, R0)])
+    S, I = N0 - R0 - I0, I0.copy()
+    step, sample_step = days / steps, max(steps // samples, 1)
+    sample_indices = range(0, steps + 1, sample_step)
+    t = np.array(sample_indices, dtype='float64') * step
+    S_samples, I_samples = np.empty(t.shape + S.shape), np.empty(t.shape + S.shape)
+    for n_sample, i in enumerate(sample_indices):
+        S_samples[n_sample], I_samples[n_sample] = S, I
+        for _ in range(min(sample_step, steps - i)):
+            if method == 'euler':
+                S, I = S*(1-a*I*step), I*(1+(a*S-b)*step)
+            else:
+                dS1, dI1 = _sir_derivatives(S, I, a, b)
+                dS2, dI2 = _sir_derivatives(S + dS1*step/2, I + dI1*step/2, a, b)
+                dS3, dI3 = _sir_derivatives(S + dS2*step/2, I + dI2*step/2, a, b)
+                dS4, dI4 = _sir_derivatives(S + dS3*step, I + dI3*step, a, b)
+                S = S + (dS1 + 2*dS2 + 2*dS3 + dS4) * step/6
+                I = I + (dI1 + 2*dI2 + 2*dI3 + dI4) * step/6
+    return SIRResult(t, S_samples, I_samples, N0 - S_samples - I_samples)
@@ -1,3 +1,13 @@
+import os, tempfile
+
+def env_setting(name:str, default, cast=str):
+    # COVID_APP_<name> converted with cast, unset or empty (docker-compose env_files write empty values) keeps the default
+    value = os.environ.get(f'COVID_APP_{name}', '').strip()
+    return cast(value) if value else default
+
+def env_flag(name:str, default:bool):
+    return env_setting(name, default, lambda value: value.lower() in ('1', 'true', 'yes'))
+
 DATE_FORMAT = '%d.%m.%Y'
 
 INITIAL_COUNTRIES = ['World','Germany','United States of America']
@@ -12,4 +22,102 @@ EXTERNAL_STYLESHEETS = [
     # 'https://raw.githubusercontent.com/plotly/dash-app-stylesheets/master/dash-technical-charting.css',
     'http://fonts.googleapis.com/css?family=Roboto',
     # 'http://fonts.googleapis.com/css?family=Dancing+Script?vfonly',
-]
\ No newline at end of file
+]
+
+# Data sources, COVID_APP_DATA_SOURCE may point to a local directory or file:// url holding the same files for offline use
+JHU_TIME_SERIES_URL = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_{dataset}_global.csv'
+JHU_US_TIME_SERIES_URL = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_{dataset}_US.csv'
+POPULATION_URL = 'https://restcountries.eu/rest/v2/all'
+DATA_SOURCE = env_setting('DATA_SOURCE', '')
+# Downloaded files and their validators, conditional GETs re-read unchanged files from here
+DATA_CACHE_DIR = env_setting('DATA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'covid_19_data_cache'))
+
+# Download settings
+FETCH_MAX_WORKERS = env_setting('FETCH_MAX_WORKERS', 4, int)
+FETCH_TIMEOUT = env_setting('FETCH_TIMEOUT', 30, float)
+POPULATION_MAX_AGE = 24 * 60 * 60
+
+# Deepest region level kept below the countries: 'country', 'province' (Province/State of the global files)
+# or 'county' (adds the states and counties of the JHU US files, which have no recovered counts)
+REGION_LEVEL = env_setting('REGION_LEVEL', 'province')
+
+# Rows per chunk when streaming the csv files, bounds the parser memory for county level files
+INGEST_CHUNK_ROWS = env_setting('INGEST_CHUNK_ROWS', 5000, int)
+
+# Snapshot of the computed dataframes shared by all workers, an empty COVID_APP_SNAPSHOT_DIR disables it
+SNAPSHOT_DIR = os.environ.get('COVID_APP_SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'covid_19_snapshot'))
+SNAPSHOT_MAX_AGE = env_setting('SNAPSHOT_MAX_AGE', 3 * 60 * 60, float)
+# Also publish every evaluated frame, so workers map them read-only instead of computing private copies
+SNAPSHOT_PUBLISH_EVALUATIONS = env_flag('SNAPSHOT_PUBLISH_EVALUATIONS', True)
+
+# Number of evaluated frames (e.g. 'daily cases' of 'deaths') each worker keeps cached
+EVALUATION_CACHE_SIZE = env_setting('EVALUATION_CACHE_SIZE', 8, int)
+
+# Seconds between checks for new data, 0 disables the background refresh
+DATA_REFRESH_INTERVAL = env_setting('DATA_REFRESH_INTERVAL', 15 * 60, float)
+# Age up to which a load reuses the shared snapshot instead of revalidating the sources, never longer than
+# the refresh interval so every refresh tick sees new upstream data
+SNAPSHOT_REUSE_AGE = min(SNAPSHOT_MAX_AGE, DATA_REFRESH_INTERVAL) if DATA_REFRESH_INTERVAL > 0 else SNAPSHOT_MAX_AGE
+
+# The first data version is loaded in a background thread so the server answers right away, failed loads are
+# retried after DATA_LOAD_RETRY_INTERVAL seconds, doubling up to DATA_REFRESH_INTERVAL. Gunicorn turns
+# COVID_APP_DATA_LOAD_ON_IMPORT off and starts the loading in every forked worker instead
+DATA_LOAD_ON_IMPORT = env_flag('DATA_LOAD_ON_IMPORT', True)
+DATA_LOAD_RETRY_INTERVAL = env_setting('DATA_LOAD_RETRY_INTERVAL', 10, float)
+
+# Number of built figures kept per worker, COVID_APP_FIGURE_CACHE_DIR shares them between workers
+FIGURE_CACHE_SIZE = env_setting('FIGURE_CACHE_SIZE', 256, int)
+FIGURE_CACHE_DIR = env_setting('FIGURE_CACHE_DIR', '')
+
+# Precomputed moving average indexes kept per worker (one per dataset x evaluation frame) and the largest
+# averaging window materialized in them, longer windows are computed from the prefix sums
+ROLLING_INDEX_CACHE_SIZE = env_setting('ROLLING_INDEX_CACHE_SIZE', 16, int)
+ROLLING_INDEX_MAX_WINDOW = 7
+
+# Render the graph in the browser from series shipped once per country/dataset selection,
+# set to False to build every figure on the server instead
+CLIENTSIDE_GRAPH = env_flag('CLIENTSIDE_GRAPH', True)
+
+# Significant digits of the values sent to the browser, 0 keeps full float precision
+FIGURE_SIGNIFICANT_DIGITS = env_setting('FIGURE_SIGNIFICANT_DIGITS', 6, int)
+
+# Ranking and alignment query results kept per worker and the largest number of regions one ranking returns
+QUERY_CACHE_SIZE = env_setting('QUERY_CACHE_SIZE', 128, int)
+RANKING_MAX_RESULTS = 200
+
+# Dates per chunk (csv) or row group (parquet) streamed by the export route
+EXPORT_CHUNK_ROWS = env_setting('EXPORT_CHUNK_ROWS', 64, int)
+
+# brotli/gzip compression of responses bigger than COMPRESSION_MIN_SIZE bytes. Callback responses are compressed
+# per request with the fast levels, the layout, dependencies and assets once per content with the static levels
+COMPRESSION_ENABLED = env_flag('COMPRESSION_ENABLED', True)
+COMPRESSION_MIN_SIZE = env_setting('COMPRESSION_MIN_SIZE', 1024, int)
+COMPRESSION_GZIP_LEVEL = env_setting('COMPRESSION_GZIP_LEVEL', 6, int)
+COMPRESSION_BROTLI_QUALITY = env_setting('COMPRESSION_BROTLI_QUALITY', 4, int)
+COMPRESSION_STATIC_GZIP_LEVEL = 9
+# brotli 11 takes seconds on plotly.js (3 MB) which would stall the first page load of every worker
+COMPRESSION_STATIC_BROTLI_QUALITY = 9
+COMPRESSION_STATIC_CACHE_SIZE = 64
+
+# Storage of the dataset tree: 'frames' keeps one float64 DataFrame per dataset, 'compact' packs the
+# cumulative counts into one int32/float32 (dataset x date x country) array and keeps evaluations as float32
+DATA_STORAGE = env_setting('DATA_STORAGE', 'frames')
+
+# Background SIR model fit per country, published as the 'SIR infected' dataset
+SIR_FIT_ENABLED = env_flag('SIR_FIT_ENABLED', True)
+SIR_FIT_WORKERS = env_setting('SIR_FIT_WORKERS', 2, int)
+SIR_FIT_WINDOW_DAYS = 60
+SIR_FIT_MIN_INFECTED = 100
+
+# Prometheus text metrics of every worker process on /metrics
+METRICS_ENABLED = env_flag('METRICS_ENABLED', True)
+
+# Opt-in sampling profiler: requests whose X-Covid-Profile header equals COVID_APP_PROFILE_TOKEN (the header is
+# ignored without a token), plus a random share of COVID_APP_PROFILE_REQUEST_RATE of all requests, are dumped as
+# collapsed stacks into PROFILE_DIR, which keeps the newest PROFILE_MAX_FILES profiles
+PROFILING_ENABLED = env_flag('PROFILING_ENABLED', False)
+PROFILE_DIR = env_setting('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'covid_19_profiles'))
+PROFILE_SAMPLE_INTERVAL = env_setting('PROFILE_SAMPLE_INTERVAL', .002, float)
+PROFILE_REQUEST_RATE = env_setting('PROFILE_REQUEST_RATE', 0, float)
+PROFILE_TOKEN = env_setting('PROFILE_TOKEN', '')
+PROFILE_MAX_FILES = env_setting('PROFILE_MAX_FILES', 200, int)